@@ -13,40 +13,24 @@ Assumptions
 • The model accepts plain text and returns a single best completion.
 """
 
-import os
-import json
-import requests
-import asyncio
-from typing import Dict, Any, List
+import mcp_client
+import documents
+from typing import Dict, List
 from state import State
-from langchain_ollama.llms import OllamaLLM
+from app_config import rag_filters
 
 # ── Llama‑3.2‑1B set‑up ────────────────────────────────────────────
 
 
-# ── MCP helper ─────────────────────────────────────────────────────
-MCP_BASE = os.getenv("MCP_BASE_URL", "http://localhost:8002")
-MCP_API = os.getenv("MCP_API_KEY")
-
-
-def _post(path: str, payload: Dict[str, Any], timeout: float = 15.0) -> Any:
-    url = f"{MCP_BASE}{path}"
-    headers = {"Content-Type": "application/json"}
-    if MCP_API:
-        headers["Authorization"] = f"Bearer {MCP_API}"
-    resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
-    resp.raise_for_status()
-    return resp.json()
-
 # ── Main agent entry point ─────────────────────────────────────────
 
 
 async def agent_2(state: State) -> Dict[str, List[str]]:
     """Return news RAG docs with sentiment tags — now using optimized query."""
-    opt_query: str = state["opt_query"]
+    opt_query: str = (state.get("opt_queries") or {}).get("news") or state["opt_query"]
 
     # 1. Community‑only vector search
-    rag_resp = _post("/rag", {
+    rag_resp = await mcp_client.post("/rag", {
         "query": opt_query,
         "collections": [
             "newsapi_embeddings",
@@ -67,20 +51,14 @@ async def agent_2(state: State) -> Dict[str, List[str]]:
 
         ],
         "top_k": 6,
+        **rag_filters(state["query"], opt_query),
     })
-    docs = rag_resp.get("results", [])
-    # Ensure each doc has a top-level 'id' for evaluation
-    for d in docs:
-        if "id" not in d:
-            meta_id = d.get("metadata", {}).get("id")
-            if meta_id:
-                d["id"] = meta_id
-            d["segment"] = "news"
-    doc_ids = [d["id"] for d in docs if "id" in d]
+    # Typed docs tagged with their segment (and a top-level id for evaluation)
+    docs = documents.from_results(rag_resp.get("results", []), "news")
 
     if not docs:
-        return {"response": ["[]"], "prompt": []}
+        return {"response": [[]], "prompt": []}
 
 
-    # 3. Serialize for router
-    return {"response": [json.dumps(docs)]}
\ No newline at end of file
+    # 3. Hand the doc objects to the router (no JSON round trip)
+    return {"response": [docs]}
\ No newline at end of file
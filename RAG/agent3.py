@@ -3,29 +3,14 @@
 # Router still does:  state["response"] += agent_2(state)["response"]
 
 from __future__ import annotations
-import os
-import json
-import requests
-import asyncio
-from typing import Dict, Any, List, TypedDict
+import mcp_client
+import documents
+from typing import Dict, List
 from state import State
-from langchain_ollama.llms import OllamaLLM
+from app_config import rag_filters
 
 # ── Llama‑3.2‑1B set‑up ────────────────────────────────────────────
 
-# ── MCP helper -----------------------------------------------------
-MCP_BASE = os.getenv("MCP_BASE_URL", "http://localhost:8002")
-MCP_API = os.getenv("MCP_API_KEY")
-
-
-def _post(path: str, payload: Dict[str, Any], timeout: float = 100.0) -> Any:
-    url, hdrs = f"{MCP_BASE}{path}", {"Content-Type": "application/json"}
-    if MCP_API:
-        hdrs["Authorization"] = f"Bearer {MCP_API}"
-    resp = requests.post(url, headers=hdrs, json=payload, timeout=timeout)
-    resp.raise_for_status()
-    return resp.json()
-
 
 # ── Collections to search -----------------------------------------
 MUSIC_COLLECTIONS = [
@@ -47,26 +32,20 @@ MUSIC_COLLECTIONS = [
 
 async def agent_3(state: State) -> Dict[str, List[str]]:
     """Return music docs (with sentiment + segment tag) — no LLM."""
-    opt_query = state["opt_query"]
+    opt_query: str = (state.get("opt_queries") or {}).get("music") or state["opt_query"]
     # 1. Vector search over news collections
-    rag_resp = _post("/rag", {
+    rag_resp = await mcp_client.post("/rag", {
         "query":       opt_query,
         "collections": MUSIC_COLLECTIONS,
-        "top_k":       6
+        "top_k":       6,
+        **rag_filters(state["query"], opt_query),
     })
-    docs = rag_resp.get("results", [])
-    # Ensure each doc has a top-level 'id' for evaluation
-    for d in docs:
-        if "id" not in d:
-            meta_id = d.get("metadata", {}).get("id")
-            if meta_id:
-                d["id"] = meta_id
-            d["segment"] = "music"
-    doc_ids = [d["id"] for d in docs if "id" in d]
+    # Typed docs tagged with their segment (and a top-level id for evaluation)
+    docs = documents.from_results(rag_resp.get("results", []), "music")
 
     if not docs:
-        return {"response": ["[]"], "prompt": []}
+        return {"response": [[]], "prompt": []}
     # 4. Return to proxy
     return {
-        "response": [json.dumps(docs)]
+        "response": [docs]
     }
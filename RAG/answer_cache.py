@@ -0,0 +1,87 @@
+"""
+End-to-end answer cache for proxy_client1
+Stores the summary + narrative produced by the LangGraph pipeline keyed on
+(normalized graph input, index build id, models, prompt version).  The graph
+input is the exact text the pipeline ran on (in cache mode it includes the
+session's recent queries), and the models are every task's model
+(model_manager.models_signature), so swapping the small rewrite / routing
+model invalidates answers as well as swapping the summary model.  The whole
+cache is dropped as soon as test_chromd publishes a new index build, so a
+cached answer never outlives the corpus it was generated from.
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from index_build import current_build_id
+from query_rewrite import normalize_query
+
+# ── Config ──────────────────────────────────────────────────────
+# Bump when the summarization or narrative prompts change.
+PROMPT_VERSION = "v1"
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))  # seconds
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (answer, created_at)
+        self._build_id = current_build_id()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_build(self) -> str:
+        build_id = current_build_id()
+        if build_id != self._build_id:
+            if self._entries:
+                print(f"[answer_cache] index build {self._build_id} -> {build_id}; "
+                      f"dropping {len(self._entries)} answers")
+            self._entries.clear()
+            self._build_id = build_id
+            self.invalidations += 1
+        return build_id or "unversioned"
+
+    def key(self, query: str, models: str) -> str:
+        parts = (normalize_query(query), self._check_build(), models, PROMPT_VERSION)
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, query: str, models: str) -> Optional[Dict]:
+        key = self.key(query, models)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[0])
+
+    def put(self, query: str, models: str, answer: Dict) -> None:
+        key = self.key(query, models)
+        self._entries[key] = (dict(answer), time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def evict(self, query: str, models: str) -> None:
+        self._entries.pop(self.key(query, models), None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "build_id": self._build_id,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+cache = AnswerCache()
@@ -0,0 +1,58 @@
+"""
+Runtime configuration for the RAG agents
+Reads RAG/config.json (bin size, cutoff date, ...) once and fills in defaults,
+so agents share the same values instead of each opening the file.
+"""
+
+import json
+import os
+
+CONFIG_PATH = os.getenv(
+    "RAG_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"))
+
+DEFAULT_CONFIG = {
+    "bin_days": 14,
+    "cutoff": "2024-06-07",
+    "date_format": "%Y-%m-%d",
+    "spike_method": "zscore",   # zscore | ewma | cusum
+    "spike_threshold": 2.0,
+    "spike_window": 0,          # trailing bins for zscore; 0 = all bins
+    # Agents' /rag date/artist filters need the normalized `date_ts` / `artist`
+    # chunk metadata; only turn on once the vector db has been rebuilt with it.
+    "rag_filters": False,
+}
+
+_cache = {"mtime": None, "config": None}
+
+
+def load_config() -> dict:
+    """Return config.json merged over the defaults; reloads when the file changes."""
+    try:
+        mtime = os.path.getmtime(CONFIG_PATH)
+    except OSError:
+        return DEFAULT_CONFIG.copy()
+    if _cache["mtime"] != mtime:
+        with open(CONFIG_PATH, "r") as f:
+            cfg = DEFAULT_CONFIG.copy()
+            cfg.update(json.load(f))
+        _cache["mtime"], _cache["config"] = mtime, cfg
+    return _cache["config"].copy()
+
+
+def rag_filters(*texts: str) -> dict:
+    """Default /rag filters: docs after the configured cutoff, and the artist
+    when the query names exactly one.  Empty unless config "rag_filters" is on."""
+    from artists import detect_artists
+
+    config = load_config()
+    if not config["rag_filters"]:
+        return {}
+    filters = {"date_from": config["cutoff"]}
+    detected = []
+    for text in texts:
+        for artist in detect_artists(text):
+            if artist not in detected:
+                detected.append(artist)
+    if len(detected) == 1:
+        filters["artist"] = detected[0]
+    return filters
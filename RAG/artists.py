@@ -0,0 +1,98 @@
+"""
+Artist vocabulary for the RAG system
+Maps artist aliases and artist-specific collections onto one canonical artist
+key, so the same key can be stored in chunk metadata at index time and used
+as a Chroma `where` filter at query time.
+"""
+
+import re
+from typing import List, Optional
+
+# ── Canonical artists and the aliases that identify them ────────
+# Full names, multi-word aliases, or single words that only ever mean the
+# artist.  Bare first names ("taylor", "lisa", "billie") match unrelated text.
+ARTIST_ALIASES = {
+    "taylor_swift": ["taylor swift", "swifties", "tswift", "eras tour"],
+    "sza": ["sza", "solana rowe", "sos tour"],
+    "beyonce": ["beyonce", "beyoncé", "queen bey", "beyhive", "cowboy carter"],
+    "blackpink": ["blackpink", "black pink", "jennie kim", "kim jisoo", "lalisa manobal",
+                  "lisa manobal"],
+    "stray_kids": ["stray kids", "straykids", "skz", "bang chan", "hwang hyunjin", "felix lee"],
+    "billie_eilish": ["billie eilish"],
+}
+
+# ── Collections that only hold content about one artist ─────────
+COLLECTION_ARTISTS = {
+    "reddit_embeddings": "taylor_swift",
+    "newsapi_embeddings": "taylor_swift",
+    "tmz_embeddings": "taylor_swift",
+    "taylornme_embeddings": "taylor_swift",
+    "vulturetaylor_embeddings": "taylor_swift",
+    "popculture_reddit_taylor_embeddings": "taylor_swift",
+    "szanme_embeddings": "sza",
+    "sza_tours_embeddings": "sza",
+    "tmz_sza_embeddings": "sza",
+    "reddit_sza_embeddings": "sza",
+    "popculture_reddit_sza_embeddings": "sza",
+    "reddit_billie_embeddings": "billie_eilish",
+    "tmz_billie_embeddings": "billie_eilish",
+    "popculture_reddit_billie_embeddings": "billie_eilish",
+    "reddit_blackpink_embeddings": "blackpink",
+    "kpop_reddit_blackpink_embeddings": "blackpink",
+    "popculture_reddit_blackpink_embeddings": "blackpink",
+    "blackpink_tours_embeddings": "blackpink",
+    "reddit_straykids_embeddings": "stray_kids",
+    "kpop_reddit_straykids_embeddings": "stray_kids",
+    "popculture_reddit_straykids_embeddings": "stray_kids",
+    "kpopnoir_reddit_straykids_embeddings": "stray_kids",
+    "newsapi_straykids_embeddings": "stray_kids",
+    "straykids_tours_embeddings": "stray_kids",
+    "dc_straykids_embeddings": "stray_kids",
+    "dc_straykids_embeddings2": "stray_kids",
+    "nbc_straykids_embeddings": "stray_kids",
+    "beyonce_tmz_embeddings": "beyonce",
+    "guardian_beyonce_embeddings": "beyonce",
+    "news_beyonce_embeddings": "beyonce",
+    "popculture_reddit_beyonce_embeddings": "beyonce",
+    "reddit_beyonce_embeddings": "beyonce",
+    "ticketmaster_beyonce_events_embeddings": "beyonce",
+}
+
+_ALIAS_PATTERNS = [
+    (artist, re.compile(r"\b" + re.escape(alias) + r"\b", re.IGNORECASE))
+    for artist, aliases in ARTIST_ALIASES.items()
+    for alias in aliases
+]
+
+
+def detect_artists(text: str) -> List[str]:
+    """Return the canonical artist keys mentioned in *text*, in first-seen order."""
+    if not text:
+        return []
+    found = []
+    for artist, pattern in _ALIAS_PATTERNS:
+        if artist not in found and pattern.search(text):
+            found.append(artist)
+    return found
+
+
+def normalize_artist(name: Optional[str]) -> Optional[str]:
+    """Map a free-form artist name (or canonical key) to its canonical key."""
+    if not name:
+        return None
+    key = name.strip().lower().replace(" ", "_")
+    if key in ARTIST_ALIASES:
+        return key
+    detected = detect_artists(name)
+    return detected[0] if detected else None
+
+
+def artist_for_chunk(collection_name: str, *texts: Optional[str]) -> Optional[str]:
+    """Artist key for a chunk: the collection's artist, else the first one named in *texts*."""
+    if collection_name in COLLECTION_ARTISTS:
+        return COLLECTION_ARTISTS[collection_name]
+    for text in texts:
+        detected = detect_artists(text or "")
+        if detected:
+            return detected[0]
+    return None
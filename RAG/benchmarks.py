@@ -0,0 +1,390 @@
+"""
+Benchmarks for the RAG pipeline
+Each subcommand times one stage against the local Chroma store and prints a
+small table; run from the RAG directory after building the vector db.
+
+    python benchmarks.py tools --docs 18 --repeat 5
+        summarization_agent's tool calls over HTTP (rag_mcp_api must be
+        running on MCP_BASE_URL) vs. the in-process transport
+
+    python benchmarks.py rerank --candidates 6 10 20 50 --top-k 6
+        /rag latency with the cross-encoder rerank for each per-collection
+        candidate count N, and how much of the largest-N top-k each N keeps
+
+    python benchmarks.py quantized --top-k 6 --rescore-factor 4
+        int8 / float16 vector sidecars (quantized_index) vs. exact float32 over
+        the collections of the hotpot eval set: scan memory, disk (Chroma +
+        sidecar), recall@k against float32 and the hit rate on the gold docs
+
+    python benchmarks.py hnsw --target-recall 0.95 --write
+        sweep hnsw:M / construction_ef / search_ef per collection size class
+        on in-memory copies of the collections, with recall@k against exact
+        search and query latency; --write saves the cheapest setting that
+        meets the target to hnsw_params.json for the next index build
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import mcp_client
+
+# ── Helpers ─────────────────────────────────────────────────────
+DEFAULT_COLLECTIONS = ["reddit_sza_embeddings", "tmz_sza_embeddings", "sza_tours_embeddings"]
+DEFAULT_QUERIES = [
+    '"SZA" tour reviews fans',
+    '"SZA" album release reaction',
+    '"SZA" concert tickets sold out',
+    '"SZA" interview news',
+]
+
+
+def _timings(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "min": ordered[0],
+    }
+
+
+def _print_table(title: str, rows: List[Dict], columns: List[str]) -> None:
+    print(f"\n{title}")
+    print("  ".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        print("  ".join(
+            f"{row[c]:>14.4f}" if isinstance(row[c], float) else f"{str(row[c]):>14}"
+            for c in columns
+        ))
+
+
+async def _time_async(fn: Callable, repeat: int) -> List[float]:
+    await fn()  # warm-up (model loading, connection setup)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def sample_docs(collections: List[str], n: int) -> List[Dict]:
+    """RAG-shaped docs ({"source", "metadata", "document"}) straight from Chroma."""
+    from test_chromd import setup_chroma
+    client = setup_chroma()
+    per = max(1, n // len(collections))
+    docs = []
+    for name in collections:
+        page = client.get_collection(name).get(limit=per, include=["documents", "metadatas"])
+        docs.extend(
+            {"source": name, "metadata": meta, "document": doc}
+            for doc, meta in zip(page["documents"], page["metadatas"])
+        )
+    return docs[:n]
+
+
+# ── tools ───────────────────────────────────────────────────────
+
+
+async def bench_tools(args) -> None:
+    docs = sample_docs(args.collections, args.docs)
+    payload = {"docs": docs}
+    print(f"{len(docs)} docs, {len(json.dumps(payload).encode('utf-8'))} bytes of JSON per call")
+    rows = []
+    for path in args.tools:
+        for transport in args.transports:
+            try:
+                samples = await _time_async(
+                    lambda: mcp_client.post(path, payload, transport=transport), args.repeat)
+            except Exception as e:
+                print(f"{path} over {transport} unavailable: {e!r}")
+                continue
+            rows.append({"tool": path.strip("/"), "transport": transport, **_timings(samples)})
+    _print_table("Tool call latency (s)", rows, ["tool", "transport", "median", "p95", "min"])
+    await mcp_client.aclose()
+
+
+# ── rerank ──────────────────────────────────────────────────────
+
+
+def _result_keys(out: Dict) -> List[tuple]:
+    return [(r.source, r.chunk_id) for r in out["results"]]
+
+
+def bench_rerank(args) -> None:
+    import rag_mcp_api
+    import reranker
+
+    def search(query: str, rerank: bool, candidates=None) -> Dict:
+        req = rag_mcp_api.RAGRequest(query=query, collections=args.collections, top_k=args.top_k,
+                                     rerank=rerank, candidates=candidates)
+        return rag_mcp_api.rag_search(req)
+
+    n_max = max(args.candidates)
+    # reference: rerank over the largest candidate pool
+    reference = {q: set(_result_keys(search(q, True, n_max))) for q in args.queries}
+    rows = []
+    configs = [("off", None)] + [("on", n) for n in sorted(args.candidates)]
+    for mode, n in configs:
+        cold, warm, kept = [], [], []
+        for q in args.queries:
+            reranker.cache.clear()  # cold: every pair scored
+            start = time.perf_counter()
+            out = search(q, mode == "on", n)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            search(q, mode == "on", n)
+            warm.append(time.perf_counter() - start)
+            kept.append(len(reference[q] & set(_result_keys(out))) / max(1, len(reference[q])))
+        rows.append({
+            "rerank": mode,
+            "N": n or args.top_k,
+            "cold_median": statistics.median(cold),
+            "warm_median": statistics.median(warm),
+            f"overlap@{args.top_k}": statistics.mean(kept),
+        })
+    _print_table(f"/rag over {len(args.collections)} collections, k={args.top_k} "
+                 f"(overlap vs. rerank with N={n_max})",
+                 rows, list(rows[0]))
+
+
+# ── quantized ───────────────────────────────────────────────────
+EVAL_PATH = "../Agentic_Workflow/hotpot_grouped_multidoc.jsonl"
+
+
+def load_eval(path: str) -> List[Dict]:
+    """hotpot-style records: {"query", "answer", "group", "supporting_contexts"}."""
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def _closest(ids: List[str], vectors, q, n: int) -> List[tuple]:
+    import numpy as np
+    diff = vectors - q
+    dists = np.einsum("ij,ij->i", diff, diff)
+    order = np.argsort(dists)[:n]
+    return [(ids[i], float(dists[i])) for i in order]
+
+
+def bench_quantized(args) -> None:
+    import numpy as np
+    from chromadb.utils import embedding_functions
+
+    import quantized_index
+    from test_chromd import setup_chroma
+
+    records = load_eval(args.eval)
+    names = args.collections or sorted(
+        {f"{ctx['source']}_embeddings" for rec in records for ctx in rec["supporting_contexts"]})
+    client = setup_chroma()
+    corpus = {}  # collection -> (ids, float32 vectors, original ids, id -> row)
+    for name in names:
+        ids, vectors, metas = quantized_index.read_collection(client.get_collection(name))
+        if ids:
+            corpus[name] = (ids, vectors, [str(m.get("original_id")) for m in metas],
+                            {cid: i for i, cid in enumerate(ids)})
+    total = sum(len(c[0]) for c in corpus.values())
+    chroma_disk = _dir_size("./chroma_storage")
+    print(f"{len(records)} queries over {len(corpus)} collections, {total} chunks "
+          f"(chroma_storage on disk: {chroma_disk / 2**20:.1f} MiB)")
+
+    embedder = embedding_functions.DefaultEmbeddingFunction()
+    queries = np.asarray(embedder([rec["query"] for rec in records]), dtype=np.float32)
+    gold = [{str(ctx["id"]) for ctx in rec["supporting_contexts"]} for rec in records]
+    k = args.top_k
+
+    def run(search: Callable) -> tuple:
+        """Per query the merged top-k {(collection, chunk id)}, median latency and gold hit rate."""
+        tops, latencies, hits = [], [], []
+        for q, gold_ids in zip(queries, gold):
+            start = time.perf_counter()
+            merged = sorted((d, name, cid) for name in corpus for cid, d in search(name, q))[:k]
+            latencies.append(time.perf_counter() - start)
+            tops.append({(name, cid) for _, name, cid in merged})
+            found = {corpus[name][2][corpus[name][3][cid]] for _, name, cid in merged}
+            hits.append(bool(gold_ids & found))
+        return tops, statistics.median(latencies), statistics.mean(hits)
+
+    def row(store: str, memory: int, sidecar: int, tops, latency: float, hit_rate: float) -> Dict:
+        recall = statistics.mean(len(ref & top) / max(1, len(ref)) for ref, top in zip(reference, tops))
+        # the sidecar is stored on top of chroma_storage, which keeps its float32 vectors
+        return {"store": store, "scan_MiB": memory / 2**20, "sidecar_MiB": sidecar / 2**20,
+                "total_disk_MiB": (chroma_disk + sidecar) / 2**20,
+                f"recall@{k}": recall, f"hit@{k}": hit_rate, "ms/query": latency * 1000}
+
+    reference, latency, hit_rate = run(lambda name, q: _closest(*corpus[name][:2], q, k))
+    float32_bytes = sum(c[1].nbytes for c in corpus.values())
+    rows = [row("float32", float32_bytes, 0, reference, latency, hit_rate)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in quantized_index.DTYPES:
+            indexes, disk = {}, 0
+            for name, (ids, vectors, _, _) in corpus.items():
+                indexes[name] = quantized_index.QuantizedIndex.build(ids, vectors, dtype=dtype)
+                path = os.path.join(tmp, f"{name}.npz")
+                indexes[name].save(path)
+                disk += os.path.getsize(path)
+            memory = sum(index.nbytes for index in indexes.values())
+
+            def rescored(name, q):
+                # float32 rows from memory stand in for _rag's Chroma get()
+                ids, vectors, _, rows_by_id = corpus[name]
+                hits = indexes[name].search(q, k * args.rescore_factor)
+                picked = [rows_by_id[cid] for cid, _ in hits]
+                return _closest([ids[r] for r in picked], vectors[picked], q, k)
+
+            rows.append(row(dtype, memory, disk, *run(lambda name, q: indexes[name].search(q, k))))
+            rows.append(row(f"{dtype}+rescore", memory, disk, *run(rescored)))
+    _print_table(f"Vector storage, k={k}, rescore x{args.rescore_factor} (scan_MiB = vectors "
+                 f"+ norms scanned per query; total_disk_MiB = chroma_storage + sidecar)",
+                 rows, list(rows[0]))
+
+
+# ── hnsw ────────────────────────────────────────────────────────
+
+
+def _sweep_collection(client, name: str, ids: List[str], vectors, queries, args) -> List[Dict]:
+    """recall@k / latency of every (M, construction_ef, search_ef) on one collection."""
+    import hnsw_tuning
+
+    k = min(args.top_k, len(ids))
+    exact = [{cid for cid, _ in _closest(ids, vectors, q, k)} for q in queries]
+    results = []
+    for m in args.M:
+        for construction_ef in args.construction_ef:
+            params = {"M": m, "construction_ef": construction_ef, "search_ef": args.search_ef[0]}
+            tmp_name = f"hnsw_sweep_{m}_{construction_ef}"
+            start = time.perf_counter()
+            coll = client.create_collection(tmp_name, metadata=hnsw_tuning.hnsw_metadata(params),
+                                            embedding_function=None)
+            for offset in range(0, len(ids), 5000):
+                coll.add(ids=ids[offset:offset + 5000], embeddings=vectors[offset:offset + 5000])
+            build = time.perf_counter() - start
+            for search_ef in args.search_ef:
+                coll.modify(configuration={"hnsw": {"ef_search": search_ef}})
+                recalls, latencies = [], []
+                for q, truth in zip(queries, exact):
+                    start = time.perf_counter()
+                    res = coll.query(query_embeddings=[q], n_results=k, include=[])
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(len(truth & set(res["ids"][0])) / max(1, k))
+                results.append({"collection": name, "M": m, "construction_ef": construction_ef,
+                                "search_ef": search_ef, "build_s": build,
+                                f"recall@{args.top_k}": statistics.mean(recalls),
+                                "ms/query": statistics.median(latencies) * 1000})
+            client.delete_collection(tmp_name)
+    return results
+
+
+def bench_hnsw(args) -> None:
+    import chromadb
+    import numpy as np
+    from chromadb.utils import embedding_functions
+
+    import hnsw_tuning
+    import quantized_index
+    from test_chromd import setup_chroma
+
+    store = setup_chroma()
+    names = args.collections or sorted(c if isinstance(c, str) else c.name
+                                       for c in store.list_collections())
+    by_class: Dict[str, List[tuple]] = {}
+    for name in names:
+        coll = store.get_collection(name)
+        by_class.setdefault(hnsw_tuning.size_class(coll.count()), []).append((coll.count(), name))
+    embedder = embedding_functions.DefaultEmbeddingFunction()
+    texts = [rec["query"] for rec in load_eval(args.eval)] if os.path.exists(args.eval) else []
+    queries = np.asarray(embedder(texts + DEFAULT_QUERIES), dtype=np.float32)
+
+    sweep = chromadb.EphemeralClient()
+    chosen = {}
+    recall_key = f"recall@{args.top_k}"
+    for size, members in by_class.items():
+        # the largest collections of each class are the slowest to search
+        rows = []
+        for count, name in sorted(members, reverse=True)[:args.per_class]:
+            ids, vectors, _ = quantized_index.read_collection(store.get_collection(name))
+            print(f"[{size}] sweeping {name} ({count} chunks)")
+            rows.extend(_sweep_collection(sweep, name, ids, vectors, queries, args))
+        if not rows:
+            continue
+        _print_table(f"HNSW sweep, size class {size!r}", rows, list(rows[0]))
+        # worst recall / latency over the class's sampled collections, per setting
+        settings: Dict[tuple, Dict] = {}
+        for row in rows:
+            key = (row["M"], row["construction_ef"], row["search_ef"])
+            agg = settings.setdefault(key, {"recall": 1.0, "ms": 0.0})
+            agg["recall"] = min(agg["recall"], row[recall_key])
+            agg["ms"] = max(agg["ms"], row["ms/query"])
+        passing = [key for key, agg in settings.items() if agg["recall"] >= args.target_recall]
+        if not passing:
+            best = max(settings, key=lambda key: settings[key]["recall"])
+            print(f"[{size}] no setting reaches recall {args.target_recall}; "
+                  f"taking the best ({settings[best]['recall']:.3f})")
+        else:
+            # fastest, then the smaller graph
+            best = min(passing, key=lambda key: (settings[key]["ms"], key[0], key[1]))
+        chosen[size] = dict(zip(("M", "construction_ef", "search_ef"), best))
+        print(f"[{size}] chosen {chosen[size]} (recall {settings[best]['recall']:.3f}, "
+              f"{settings[best]['ms']:.2f} ms/query)")
+    if args.write and chosen:
+        hnsw_tuning.save_params(chosen)
+        print(f"Wrote {hnsw_tuning.HNSW_PARAMS_PATH}; rebuild the index (test_chromd.py) to apply")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    tools = commands.add_parser("tools", help="HTTP vs. in-process tool transport")
+    tools.add_argument("--docs", type=int, default=18, help="docs per tool call")
+    tools.add_argument("--repeat", type=int, default=5)
+    tools.add_argument("--collections", nargs="+", default=DEFAULT_COLLECTIONS)
+    tools.add_argument("--tools", nargs="+", default=["/sentiment_tool", "/ner_person_tool"],
+                       help="geolocation also geocodes over the network")
+    tools.add_argument("--transports", nargs="+", default=["http", "inprocess"])
+    tools.set_defaults(run=bench_tools)
+
+    rerank = commands.add_parser("rerank", help="cross-encoder rerank: candidates N vs. top_k")
+    rerank.add_argument("--candidates", type=int, nargs="+", default=[6, 10, 20, 50],
+                        help="per-collection candidate counts N")
+    rerank.add_argument("--top-k", type=int, default=6)
+    rerank.add_argument("--collections", nargs="+", default=DEFAULT_COLLECTIONS)
+    rerank.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+    rerank.set_defaults(run=bench_rerank)
+
+    quantized = commands.add_parser("quantized", help="int8 / float16 vectors vs. float32")
+    quantized.add_argument("--eval", default=EVAL_PATH)
+    quantized.add_argument("--collections", nargs="+",
+                           help="default: the collections of the eval set's gold sources")
+    quantized.add_argument("--top-k", type=int, default=6)
+    quantized.add_argument("--rescore-factor", type=int, default=4)
+    quantized.set_defaults(run=bench_quantized)
+
+    hnsw = commands.add_parser("hnsw", help="HNSW params per size class: recall@k vs. latency")
+    hnsw.add_argument("--collections", nargs="+", help="default: every collection in Chroma")
+    hnsw.add_argument("--per-class", type=int, default=2,
+                      help="largest collections swept per size class")
+    hnsw.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    hnsw.add_argument("--construction-ef", type=int, nargs="+", default=[64, 128, 256])
+    hnsw.add_argument("--search-ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    hnsw.add_argument("--top-k", type=int, default=6)
+    hnsw.add_argument("--target-recall", type=float, default=0.95)
+    hnsw.add_argument("--eval", default=EVAL_PATH, help="queries to sweep with (plus the defaults)")
+    hnsw.add_argument("--write", action="store_true", help="save the chosen params to hnsw_params.json")
+    hnsw.set_defaults(run=bench_hnsw)
+
+    args = arg_parser.parse_args()
+    result = args.run(args)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
@@ -0,0 +1,166 @@
+"""
+Collection routing for rag_mcp_api._rag
+The agents pass long collection lists (agent_1 alone names 18) and _rag used
+to run one HNSW query per collection, so a Taylor Swift question also
+searched reddit_blackpink and kpop_reddit_straykids.  The router picks the
+collections worth probing before any vector search runs:
+
+1. Artist: collections that only hold another artist's content (artists.
+   COLLECTION_ARTISTS) are dropped when the query or the request's artist
+   filter names an artist.  With an artist filter they could not return
+   anything anyway; mixed collections (twitter, billboard, ...) stay.
+2. Centroid: the remaining collections are ranked by cosine similarity of
+   the query to the collection's mean chunk embedding (computed at build
+   time by test_chromd) and the best ROUTER_K are kept.
+
+Recall safety: a collection within ROUTER_MARGIN of the k-th best similarity
+is kept as well, collections without a centroid are always probed, and when
+no centroid is at least ROUTER_MIN_SIMILARITY to the query (nothing looks
+relevant) routing is skipped and every artist-compatible collection is probed.
+
+Routing is opt-in: per request with ``route=True``, or for every request
+with RAG_ROUTE=1.  Rebuild the centroids when collections change; a stale
+file can rank a collection lower than it deserves.
+
+Centroids live in one JSON file next to the vector db (``CENTROIDS_PATH``):
+    {collection: {"centroid": [...], "count", "built_at"}}
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from artists import COLLECTION_ARTISTS, detect_artists
+
+# ── Config ──────────────────────────────────────────────────────
+CENTROIDS_PATH = os.getenv("COLLECTION_CENTROIDS_PATH", "./chroma_storage/centroids.json")
+ROUTE_DEFAULT = os.getenv("RAG_ROUTE", "0") == "1"  # opt-in, like rerank
+ROUTER_K = int(os.getenv("ROUTER_K", "6"))  # collections probed per query
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.05"))  # cosine slack below the k-th best
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.15"))
+BATCH = 5000  # embeddings read per get() while building a centroid
+
+_cache = {"mtime": None, "names": [], "matrix": None}
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "requested": 0, "probed": 0, "artist_pruned": 0,
+          "centroid_pruned": 0, "fallbacks": 0}
+
+
+# ── Build ───────────────────────────────────────────────────────
+
+
+def centroid(collection) -> Optional[Dict]:
+    """Mean (unit-normalized) chunk embedding of one Chroma collection."""
+    count = collection.count()
+    if not count:
+        return None
+    total = None
+    for offset in range(0, count, BATCH):
+        page = collection.get(limit=BATCH, offset=offset, include=["embeddings"])
+        embs = np.asarray(page["embeddings"], dtype=np.float32)
+        if not len(embs):
+            break
+        embs /= np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+        part = embs.sum(axis=0)
+        total = part if total is None else total + part
+    if total is None:
+        return None
+    return {"centroid": (total / count).tolist(), "count": count, "built_at": time.time()}
+
+
+def save(name: str, entry: Optional[Dict], path: str = CENTROIDS_PATH) -> None:
+    """Record (or with entry=None, drop) one collection's centroid."""
+    try:
+        with open(path, "r") as f:
+            all_entries = json.load(f)
+    except OSError:
+        all_entries = {}
+    if entry is None:
+        all_entries.pop(name, None)
+    else:
+        all_entries[name] = entry
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(all_entries, f)
+    os.replace(tmp, path)
+
+
+def build_and_save(collection, path: str = CENTROIDS_PATH) -> Optional[Dict]:
+    entry = centroid(collection)
+    save(collection.name, entry, path)
+    return entry
+
+
+# ── Query time ──────────────────────────────────────────────────
+
+
+def _centroids(path: str = CENTROIDS_PATH):
+    """(names, unit-normalized centroid matrix); re-read when the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return [], None
+    if _cache["mtime"] != mtime:
+        with open(path, "r") as f:
+            entries = json.load(f)
+        names = list(entries)
+        matrix = np.asarray([entries[n]["centroid"] for n in names],
+                            dtype=np.float32).reshape(len(names), -1)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        _cache.update(mtime=mtime, names=names, matrix=matrix)
+    return _cache["names"], _cache["matrix"]
+
+
+def similarities(query_emb, collections: List[str]) -> Dict[str, float]:
+    """Cosine similarity of the query to each collection centroid (if built)."""
+    names, matrix = _centroids()
+    if matrix is None or not len(names):
+        return {}
+    q = np.asarray(query_emb, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    sims = matrix @ q
+    wanted = set(collections)
+    return {n: float(s) for n, s in zip(names, sims) if n in wanted}
+
+
+def route(query: str, query_emb, collections: List[str], artist: Optional[str] = None,
+          k: int = ROUTER_K) -> List[str]:
+    """Subset of *collections* worth probing for *query*, in their original order."""
+    artists = {artist} if artist else set(detect_artists(query))
+    compatible = [c for c in collections
+                  if not artists or COLLECTION_ARTISTS.get(c) in (None, *artists)]
+    if not compatible and not artist:
+        compatible = list(collections)  # detection only; don't route to nothing
+    sims = similarities(query_emb, compatible)
+    ranked = sorted(sims, key=lambda c: -sims[c])
+    fallback = not ranked or sims[ranked[0]] < ROUTER_MIN_SIMILARITY
+    if fallback or len(compatible) <= k:
+        chosen = compatible
+    else:
+        floor = sims[ranked[min(k, len(ranked)) - 1]] - ROUTER_MARGIN
+        keep = {c for c in ranked if sims[c] >= floor}
+        chosen = [c for c in compatible if c in keep or c not in sims]
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["requested"] += len(collections)
+        _stats["probed"] += len(chosen)
+        _stats["artist_pruned"] += len(collections) - len(compatible)
+        _stats["centroid_pruned"] += len(compatible) - len(chosen)
+        _stats["fallbacks"] += int(fallback)
+    if len(chosen) < len(collections):
+        print(f"[collection_router] probing {len(chosen)}/{len(collections)} collections"
+              f"{' (artist ' + ', '.join(sorted(artists)) + ')' if artists else ''}")
+    return chosen
+
+
+def stats() -> Dict[str, float]:
+    with _stats_lock:
+        out = dict(_stats)
+    out["avg_probed"] = out["probed"] / out["requests"] if out["requests"] else 0.0
+    out["centroids"] = len(_centroids()[0])
+    return out
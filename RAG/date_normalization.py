@@ -0,0 +1,104 @@
+"""
+Index-time date normalization for the RAG system
+Turns the heterogeneous date values coming out of Postgres (datetimes, ISO
+strings, Billboard week strings, dates found in the text) into chunk metadata
+that can be compared and binned with integer arithmetic:
+
+    date             ISO string (kept for display)
+    date_ts          epoch seconds (UTC)
+    date_week        7-day bucket id
+    date_biweek      14-day bucket id
+    date_confidence  "column" when the date came from the row's date field,
+                     "text" when it was extracted from the title/body
+
+Bucket ids count whole periods since BIN_ANCHOR_TS (a Monday), so they are
+stable across rebuilds and identical for every collection.
+"""
+
+import calendar
+import datetime
+import re
+from typing import Optional
+
+from dateutil import parser as date_parser
+
+# ── Config ──────────────────────────────────────────────────────
+DAY_SECONDS = 86400
+BIN_ANCHOR_TS = 4 * DAY_SECONDS  # 1970-01-05, the first Monday after the epoch
+TEXT_DATE_RE = re.compile(r'(\w{3,9} \d{1,2}, \d{4})')
+
+
+def epoch_seconds(value) -> int:
+    """Epoch seconds for a date/datetime; naive values are treated as UTC."""
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return calendar.timegm(value.utctimetuple())
+
+
+def parse_date(value) -> Optional[datetime.datetime]:
+    """Parse a row's date field; returns None when it is not a date."""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    try:
+        return date_parser.parse(str(value))
+    except (ValueError, OverflowError) as e:
+        print(f"Could not parse date '{value}': {e}")
+        return None
+
+
+def extract_date_from_text(*texts: Optional[str]) -> Optional[datetime.datetime]:
+    """First "Month D, YYYY" style date found in *texts*."""
+    for text in texts:
+        if not text:
+            continue
+        match = TEXT_DATE_RE.search(str(text))
+        if match:
+            try:
+                return date_parser.parse(match.group(1))
+            except (ValueError, OverflowError):
+                continue
+    return None
+
+
+def bucket_id(date_ts: int, bin_days: int) -> int:
+    """Anchored bucket id of width *bin_days* for an epoch timestamp."""
+    return (date_ts - BIN_ANCHOR_TS) // (bin_days * DAY_SECONDS)
+
+
+def bucket_start_ts(bucket: int, bin_days: int) -> int:
+    """Epoch timestamp where bucket *bucket* of width *bin_days* starts."""
+    return BIN_ANCHOR_TS + bucket * bin_days * DAY_SECONDS
+
+
+def date_metadata(value, *text_fields: Optional[str]) -> dict:
+    """Normalized date metadata for a row; {} when no date can be found."""
+    parsed = parse_date(value)
+    confidence = "column"
+    if parsed is None:
+        parsed = extract_date_from_text(*text_fields)
+        confidence = "text"
+    if parsed is None:
+        return {}
+    date_ts = epoch_seconds(parsed)
+    return {
+        "date": parsed.isoformat(),
+        "date_ts": date_ts,
+        "date_week": bucket_id(date_ts, 7),
+        "date_biweek": bucket_id(date_ts, 14),
+        "date_confidence": confidence,
+    }
+
+
+def meta_bucket(meta: dict, bin_days: int) -> Optional[int]:
+    """Bucket id for a chunk's metadata, using the precomputed ids when they fit."""
+    if not meta or meta.get("date_ts") is None:
+        return None
+    if bin_days == 7 and "date_week" in meta:
+        return meta["date_week"]
+    if bin_days == 14 and "date_biweek" in meta:
+        return meta["date_biweek"]
+    return bucket_id(meta["date_ts"], bin_days)
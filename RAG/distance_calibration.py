@@ -0,0 +1,107 @@
+"""
+Per-collection distance calibration
+Every collection is its own HNSW index with its own density: a distance of
+0.9 is a close hit in a sparse Reddit collection and a poor one in the 50-row
+sza_tours collection, so sorting raw distances across collections lets small
+or dense collections dominate (or vanish) arbitrarily.
+
+At build time test_chromd samples stored chunks from each collection, queries
+them back against the collection and records the mean / std of their k nearest
+neighbour distances (the "background" a relevant hit has to beat).  _rag then
+merges hits on the z-score ``(distance - mean) / std`` instead of the raw
+distance.  If any probed collection has no calibration, _rag falls back to
+fusing the per-collection rankings by rank (RRF), which needs no scale at all.
+
+Stats live in one JSON file next to the vector db (``CALIBRATION_PATH``):
+    {collection: {"mean", "std", "k", "samples", "count", "built_at"}}
+"""
+
+import json
+import os
+import random
+import statistics
+import time
+from typing import Dict, Optional
+
+# ── Config ──────────────────────────────────────────────────────
+CALIBRATION_PATH = os.getenv("DISTANCE_CALIBRATION_PATH", "./chroma_storage/calibration.json")
+SAMPLES = int(os.getenv("CALIBRATION_SAMPLES", "64"))  # chunks queried per collection
+K = int(os.getenv("CALIBRATION_K", "10"))  # neighbour distances kept per sampled chunk
+MIN_STD = 1e-6
+
+_cache = {"mtime": None, "stats": {}}
+
+
+# ── Build ───────────────────────────────────────────────────────
+
+
+def calibrate(collection, samples: int = SAMPLES, k: int = K, seed: int = 0) -> Optional[Dict]:
+    """Background distance stats for one Chroma collection (None if too small)."""
+    count = collection.count()
+    if count < 2:
+        return None
+    k = min(k, count - 1)
+    ids = collection.get(include=[])["ids"]
+    chosen = random.Random(seed).sample(ids, min(samples, len(ids)))
+    got = collection.get(ids=chosen, include=["embeddings"])
+    res = collection.query(query_embeddings=list(got["embeddings"]), n_results=k + 1,
+                           include=["distances"])
+    distances = []
+    for qid, row_ids, row_dists in zip(got["ids"], res["ids"], res["distances"]):
+        # drop the sampled chunk itself
+        distances.extend([d for cid, d in zip(row_ids, row_dists) if cid != qid][:k])
+    if len(distances) < 2:
+        return None
+    return {
+        "mean": statistics.fmean(distances),
+        "std": statistics.pstdev(distances),
+        "k": k,
+        "samples": len(chosen),
+        "count": count,
+        "built_at": time.time(),
+    }
+
+
+def save(name: str, stats: Optional[Dict], path: str = CALIBRATION_PATH) -> None:
+    """Record (or with stats=None, drop) one collection's calibration."""
+    all_stats = dict(load(path))
+    if stats is None:
+        all_stats.pop(name, None)
+    else:
+        all_stats[name] = stats
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(all_stats, f, indent=1)
+    os.replace(tmp, path)
+
+
+def calibrate_and_save(collection, path: str = CALIBRATION_PATH) -> Optional[Dict]:
+    stats = calibrate(collection)
+    save(collection.name, stats, path)
+    return stats
+
+
+# ── Query time ──────────────────────────────────────────────────
+
+
+def load(path: str = CALIBRATION_PATH) -> Dict[str, Dict]:
+    """All calibrations; re-read when the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    if _cache["mtime"] != mtime:
+        with open(path, "r") as f:
+            _cache["stats"] = json.load(f)
+        _cache["mtime"] = mtime
+    return _cache["stats"]
+
+
+def stats_for(name: str) -> Optional[Dict]:
+    return load().get(name)
+
+
+def z_score(distance: float, stats: Dict) -> float:
+    """Distance in std units from the collection's background (lower = closer)."""
+    return (distance - stats["mean"]) / max(stats["std"], MIN_STD)
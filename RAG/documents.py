@@ -0,0 +1,171 @@
+"""
+Retrieved documents as typed in-memory objects
+The segment agents used to ``json.dumps`` their doc lists into
+``state["response"]`` strings that proxy_agent2 joined and
+summarization_agent parsed again.  Docs now travel through the LangGraph
+state as ``Doc`` objects; they are only encoded at process boundaries (HTTP
+tool calls, the websocket answer) with the codec below:
+
+    json     orjson when installed (serializes Doc natively), else stdlib json
+    msgpack  ormsgpack (binary, smaller and faster to decode than JSON)
+
+On the retrieval side rag_mcp_api ranks ``RetrievalResult`` hits that carry
+only ids and scores; text and metadata are materialized (one batched get per
+collection) for the hits that survive ranking, so raising top_k or the
+number of collections does not allocate a document per candidate.
+Source and segment names are interned: thousands of docs share a handful of
+strings.
+"""
+
+import json
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:
+    ormsgpack = None
+
+
+@dataclass(slots=True)
+class Doc:
+    source: str
+    document: str
+    metadata: dict
+    segment: str = "unknown"
+    id: Optional[str] = None
+    chunk_id: Optional[str] = None
+    distance: Optional[float] = None
+    distance_z: Optional[float] = None
+    bm25: Optional[float] = None
+    rrf_score: Optional[float] = None
+    rerank_score: Optional[float] = None
+    sentiment: Optional[dict] = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """dict-style read, so tool code written against result dicts keeps working."""
+        value = getattr(self, key, None) if key in DOC_FIELDS else None
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        # shallow: asdict() would deep-copy every metadata dict
+        return {k: v for k in FIELD_NAMES if (v := getattr(self, k)) is not None}
+
+
+FIELD_NAMES = tuple(f.name for f in fields(Doc))
+DOC_FIELDS = frozenset(FIELD_NAMES)
+
+
+class RetrievalResult:
+    """One ranked hit; ``document`` / ``metadata`` stay None until materialize()."""
+
+    __slots__ = ("source", "chunk_id", "distance", "distance_z", "bm25", "rrf_score",
+                 "rerank_score", "document", "metadata")
+
+    def __init__(self, source: str, chunk_id: str, distance: float,
+                 document: Optional[str] = None, metadata: Optional[dict] = None):
+        self.source = sys.intern(source)
+        self.chunk_id = chunk_id
+        self.distance = distance
+        self.distance_z = None
+        self.bm25 = None
+        self.rrf_score = None
+        self.rerank_score = None
+        self.document = document
+        self.metadata = metadata
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {
+            "source": self.source,
+            "document": self.document,
+            "metadata": self.metadata,
+            "distance": self.distance,
+            "chunk_id": self.chunk_id,
+        }
+        if self.distance_z is not None:
+            out["distance_z"] = self.distance_z
+        if self.bm25 is not None:
+            out["bm25"] = self.bm25
+        if self.rrf_score is not None:
+            out["rrf_score"] = self.rrf_score
+        if self.rerank_score is not None:
+            out["rerank_score"] = self.rerank_score
+        return out
+
+
+def materialize(hits: List[RetrievalResult], get_collection: Callable) -> List[RetrievalResult]:
+    """Load text and metadata for *hits* with one ``get`` per collection."""
+    pending = defaultdict(list)
+    for hit in hits:
+        if hit.document is None:
+            pending[hit.source].append(hit)
+    for source, group in pending.items():
+        got = get_collection(source).get(ids=[h.chunk_id for h in group],
+                                         include=["documents", "metadatas"])
+        loaded = {cid: (doc, meta) for cid, doc, meta in
+                  zip(got["ids"], got["documents"], got["metadatas"])}
+        for hit in group:
+            hit.document, hit.metadata = loaded.get(hit.chunk_id, ("", {}))
+    return hits
+
+
+def from_result(result: Union[Dict[str, Any], RetrievalResult], segment: Optional[str] = None) -> Doc:
+    """Doc from one /rag result (unknown keys are dropped)."""
+    if isinstance(result, RetrievalResult):
+        doc = Doc(result.source, result.document or "", result.metadata or {},
+                  chunk_id=result.chunk_id, distance=result.distance,
+                  distance_z=result.distance_z, bm25=result.bm25, rrf_score=result.rrf_score,
+                  rerank_score=result.rerank_score)
+    else:
+        doc = Doc(**{k: v for k, v in result.items() if k in DOC_FIELDS})
+        doc.source = sys.intern(doc.source)
+    doc.metadata = doc.metadata or {}
+    if doc.id is None:
+        doc.id = doc.metadata.get("id")
+    if segment is not None:
+        doc.segment = sys.intern(segment)
+    return doc
+
+
+def from_results(results: Iterable[Dict[str, Any]], segment: Optional[str] = None) -> List[Doc]:
+    return [from_result(r, segment) for r in results]
+
+
+def to_dicts(docs: Iterable[Doc]) -> List[Dict[str, Any]]:
+    return [d.to_dict() for d in docs]
+
+
+# ── Codec ───────────────────────────────────────────────────────
+
+
+def _default(obj):
+    if isinstance(obj, Doc):
+        return obj.to_dict()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def dumps(obj: Any, fmt: str = "json") -> bytes:
+    if fmt == "msgpack":
+        if ormsgpack is None:
+            raise RuntimeError("msgpack format needs ormsgpack (pip install ormsgpack)")
+        return ormsgpack.packb(obj, default=_default)
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default).encode("utf-8")
+
+
+def loads(data: bytes, fmt: str = "json") -> Any:
+    if fmt == "msgpack":
+        if ormsgpack is None:
+            raise RuntimeError("msgpack format needs ormsgpack (pip install ormsgpack)")
+        return ormsgpack.unpackb(data)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
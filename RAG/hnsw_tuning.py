@@ -0,0 +1,157 @@
+"""
+HNSW parameters per collection size class
+Collections used to be created with Chroma's default HNSW settings whether
+they hold 50 tour dates or 50k Reddit chunks.  test_chromd now creates each
+collection with the parameters of its size class, passed as the ``hnsw:*``
+collection metadata (Chroma turns them into the index configuration at
+creation time only, so ensure_collection swaps in a copy of an existing
+collection whose stored params differ):
+
+    hnsw:M                graph degree (memory, recall)
+    hnsw:construction_ef  build-time beam width (build time, graph quality)
+    hnsw:search_ef        query-time beam width (latency, recall)
+
+The chosen values live in hnsw_params.json next to this file.  Until
+``python benchmarks.py hnsw --write`` has tuned them (sweep per size class,
+recall@k against exact search and latency), DEFAULT_PARAMS are used.  The
+space stays "l2": _rag, distance_calibration and quantized_index all work
+in squared L2.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Tuple
+
+# ── Config ──────────────────────────────────────────────────────
+HNSW_PARAMS_PATH = os.getenv(
+    "HNSW_PARAMS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "hnsw_params.json"))
+SPACE = "l2"
+
+# (upper bound on chunk count, size class), smallest first
+SIZE_CLASSES: List[Tuple[float, str]] = [
+    (1_000, "small"),
+    (20_000, "medium"),
+    (float("inf"), "large"),
+]
+
+PARAM_KEYS = ("M", "construction_ef", "search_ef")
+COPY_BATCH = 5000  # chunks per get()/add() when recreating a collection
+TMP_SUFFIX = "__hnsw_swap"  # temporary collection used while recreating
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARAMS = {
+    "small": {"M": 16, "construction_ef": 100, "search_ef": 100},
+    "medium": {"M": 16, "construction_ef": 200, "search_ef": 100},
+    "large": {"M": 32, "construction_ef": 200, "search_ef": 128},
+}
+
+
+def size_class(count: int) -> str:
+    for bound, name in SIZE_CLASSES:
+        if count <= bound:
+            return name
+    return SIZE_CLASSES[-1][1]
+
+
+def load_params(path: str = HNSW_PARAMS_PATH) -> Dict[str, Dict[str, int]]:
+    """Tuned params per size class, over the defaults."""
+    params = {name: dict(values) for name, values in DEFAULT_PARAMS.items()}
+    try:
+        with open(path, "r") as f:
+            tuned = json.load(f)
+    except OSError:
+        return params
+    for name, values in tuned.items():
+        params.setdefault(name, {}).update(
+            {k: v for k, v in values.items() if k in PARAM_KEYS})
+    return params
+
+
+def save_params(params: Dict[str, Dict], path: str = HNSW_PARAMS_PATH) -> None:
+    """Write the tuned params (merged over the file's other size classes)."""
+    try:
+        with open(path, "r") as f:
+            current = json.load(f)
+    except OSError:
+        current = {}
+    current.update(params)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(current, f, indent=2)
+    os.replace(tmp, path)
+
+
+def hnsw_metadata(params: Dict[str, int]) -> Dict[str, object]:
+    return {
+        "hnsw:space": SPACE,
+        "hnsw:M": params["M"],
+        "hnsw:construction_ef": params["construction_ef"],
+        "hnsw:search_ef": params["search_ef"],
+    }
+
+
+def collection_metadata(count: int) -> Dict[str, object]:
+    """Creation metadata for a collection about to hold *count* chunks."""
+    name = size_class(count)
+    return {**hnsw_metadata(load_params()[name]), "size_class": name}
+
+
+def stored_params(collection) -> Dict[str, object]:
+    """The hnsw:* params a collection was created with (None where unset)."""
+    metadata = collection.metadata or {}
+    return {k: metadata.get(f"hnsw:{k}") for k in PARAM_KEYS}
+
+
+def _collection_names(client) -> List[str]:
+    # chromadb < 0.6 returns Collection objects, later versions return names
+    return [c if isinstance(c, str) else c.name for c in client.list_collections()]
+
+
+def ensure_collection(client, name: str, count: int):
+    """Collection *name* created with the HNSW params of its size class.
+
+    The class is sized by the larger of the stored chunk count and *count*
+    (the chunks about to be upserted), so a partial rebuild does not shrink
+    it.  An existing collection with other params (or Chroma's defaults) is
+    copied page by page, embeddings included, into a temporary collection
+    created with the tuned params, which then replaces it (delete + rename).
+    If the copy fails the original is left untouched; a temporary collection
+    left behind by a swap interrupted after the delete is renamed back."""
+    tmp_name = name + TMP_SUFFIX
+    names = _collection_names(client)
+    if name not in names and tmp_name in names:
+        logger.warning(f"Restoring '{name}' from interrupted HNSW swap '{tmp_name}'.")
+        client.get_collection(tmp_name).modify(name=name)
+        names.append(name)
+    if name not in names:
+        return client.create_collection(name=name, metadata=collection_metadata(count))
+    collection = client.get_collection(name)
+    stored = collection.count()
+    metadata = collection_metadata(max(stored, count))
+    wanted = {k: metadata[f"hnsw:{k}"] for k in PARAM_KEYS}
+    current = stored_params(collection)
+    if current == wanted:
+        return collection
+    if tmp_name in names:
+        client.delete_collection(tmp_name)  # stale copy from a failed swap
+    tmp = client.create_collection(name=tmp_name, metadata=metadata)
+    try:
+        for offset in range(0, stored, COPY_BATCH):
+            page = collection.get(limit=COPY_BATCH, offset=offset,
+                                  include=["documents", "metadatas", "embeddings"])
+            if page["ids"]:
+                tmp.add(ids=page["ids"], documents=page["documents"],
+                        metadatas=page["metadatas"], embeddings=page["embeddings"])
+        if tmp.count() != stored:
+            raise RuntimeError(f"copied {tmp.count()} of {stored} chunks")
+    except Exception:
+        logger.exception(f"HNSW params for '{name}' not applied; keeping {current}.")
+        client.delete_collection(tmp_name)
+        return collection
+    client.delete_collection(name)
+    tmp.modify(name=name)
+    logger.info(f"Recreated '{name}' ({metadata['size_class']}) with {wanted} "
+                f"(was {current}); copied {stored} chunks.")
+    return tmp
@@ -0,0 +1,40 @@
+"""
+Index build id
+test_chromd publishes a new build id every time it rebuilds the vector db;
+anything cached against the corpus (e.g. answer_cache) compares against the
+current id and drops itself when the index changes.
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+BUILD_ID_PATH = os.getenv("INDEX_BUILD_ID_PATH", "./chroma_storage/build_id.json")
+
+_cache = {"mtime": None, "build_id": None}
+
+
+def publish_build_id(path: str = BUILD_ID_PATH) -> str:
+    """Write a fresh build id; call after the collections are rebuilt."""
+    build_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"build_id": build_id, "built_at": time.time()}, f)
+    os.replace(tmp, path)
+    return build_id
+
+
+def current_build_id(path: str = BUILD_ID_PATH) -> Optional[str]:
+    """Id of the published index build (None if never published); re-read on change."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _cache["mtime"] != mtime:
+        with open(path, "r") as f:
+            _cache["build_id"] = json.load(f).get("build_id")
+        _cache["mtime"] = mtime
+    return _cache["build_id"]
@@ -0,0 +1,262 @@
+"""
+Lexical (BM25) index for the RAG system
+This file builds, stores and searches a BM25 inverted index over the same
+chunks that go into Chroma, so exact names and dates can be matched.
+
+On-disk layout (one file per collection, ``<LEXICAL_DIR>/<collection>.bm25``):
+    MAGIC | header length (4 bytes) | zlib(JSON header) | postings blob
+The postings blob holds, per term, varint-encoded (doc gap, term frequency)
+pairs.  The header maps each term to its (df, offset, length) slice, so a
+query only decodes the postings of its own terms.  Each chunk's `date_ts`
+and `artist` metadata is kept in the header so BM25 hits honour the same
+filters as the Chroma `where` clause.
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# ── Config ──────────────────────────────────────────────────────
+LEXICAL_DIR = os.getenv("LEXICAL_INDEX_DIR", "./lexical_index")
+MAGIC = b"BM25\x01"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # standard reciprocal-rank-fusion damping constant
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has",
+    "he", "in", "is", "it", "its", "of", "on", "or", "that", "the", "to",
+    "was", "were", "will", "with", "this", "but", "they", "have", "had",
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed."""
+    if not text:
+        return []
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+# ── Varint coding ───────────────────────────────────────────────
+
+
+def _encode_varints(values: Iterable[int]) -> bytes:
+    out = bytearray()
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def _decode_varints(buf: bytes) -> List[int]:
+    values, cur, shift = [], 0, 0
+    for byte in buf:
+        cur |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(cur)
+            cur, shift = 0, 0
+    return values
+
+
+# ── Index ───────────────────────────────────────────────────────
+
+
+class BM25Index:
+    """Read-only BM25 index backed by compressed postings."""
+
+    def __init__(self, doc_ids: List[str], doc_lens: List[int],
+                 terms: Dict[str, List[int]], postings: bytes,
+                 k1: float = BM25_K1, b: float = BM25_B,
+                 doc_dates: Optional[List[Optional[int]]] = None,
+                 doc_artists: Optional[List[Optional[str]]] = None):
+        self.doc_ids = doc_ids
+        self.doc_lens = doc_lens
+        self.doc_dates = doc_dates or [None] * len(doc_ids)
+        self.doc_artists = doc_artists or [None] * len(doc_ids)
+        self.terms = terms          # term -> [df, offset, length]
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avgdl = (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Sequence[str],
+              metadatas: Optional[Sequence[dict]] = None) -> "BM25Index":
+        """Build an index from parallel lists of chunk ids, texts and metadata."""
+        inverted: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lens = []
+        for ordinal, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                inverted.setdefault(tok, []).append((ordinal, tf))
+
+        blob = bytearray()
+        terms: Dict[str, List[int]] = {}
+        for term in sorted(inverted):
+            plist = inverted[term]
+            flat, prev = [], 0
+            for ordinal, tf in plist:
+                flat.extend((ordinal - prev, tf))
+                prev = ordinal
+            encoded = _encode_varints(flat)
+            terms[term] = [len(plist), len(blob), len(encoded)]
+            blob.extend(encoded)
+        metadatas = metadatas or [{}] * len(doc_lens)
+        return cls(list(ids), doc_lens, terms, bytes(blob),
+                   doc_dates=[m.get("date_ts") for m in metadatas],
+                   doc_artists=[m.get("artist") for m in metadatas])
+
+    def _postings(self, term: str) -> List[Tuple[int, int]]:
+        entry = self.terms.get(term)
+        if entry is None:
+            return []
+        _, offset, length = entry
+        flat = _decode_varints(self.postings[offset:offset + length])
+        out, ordinal = [], 0
+        for i in range(0, len(flat), 2):
+            ordinal += flat[i]
+            out.append((ordinal, flat[i + 1]))
+        return out
+
+    def _allowed(self, ordinal: int, date_from: Optional[int],
+                 date_to: Optional[int], artist: Optional[str]) -> bool:
+        if artist is not None and self.doc_artists[ordinal] != artist:
+            return False
+        if date_from is None and date_to is None:
+            return True
+        ts = self.doc_dates[ordinal]
+        if ts is None:
+            return False
+        return (date_from is None or ts >= date_from) and (date_to is None or ts <= date_to)
+
+    def search(self, query: str, top_k: int = 5, date_from: Optional[int] = None,
+               date_to: Optional[int] = None, artist: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Return up to *top_k* (chunk_id, bm25_score) pairs, best first.
+
+        *date_from*/*date_to* (epoch seconds) and *artist* mirror the filters
+        pushed into the Chroma query."""
+        n_docs = len(self.doc_ids)
+        if not n_docs:
+            return []
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self.terms.get(term)
+            if entry is None:
+                continue
+            df = entry[0]
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for ordinal, tf in self._postings(term):
+                norm = 1 - self.b + self.b * self.doc_lens[ordinal] / self.avgdl
+                scores[ordinal] = scores.get(ordinal, 0.0) + \
+                    idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        filtered = date_from is not None or date_to is not None or artist is not None
+        candidates = ((o, s) for o, s in scores.items()
+                      if not filtered or self._allowed(o, date_from, date_to, artist))
+        best = heapq.nlargest(top_k, candidates, key=lambda kv: kv[1])
+        return [(self.doc_ids[o], s) for o, s in best]
+
+    # ── Persistence ─────────────────────────────────────────────
+
+    def save(self, path: str) -> None:
+        header = zlib.compress(json.dumps({
+            "doc_ids": self.doc_ids,
+            "doc_lens": self.doc_lens,
+            "doc_dates": self.doc_dates,
+            "doc_artists": self.doc_artists,
+            "terms": self.terms,
+            "k1": self.k1,
+            "b": self.b,
+        }).encode("utf-8"))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(self.postings)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a BM25 index file: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(zlib.decompress(f.read(header_len)))
+            postings = f.read()
+        return cls(header["doc_ids"], header["doc_lens"], header["terms"],
+                   postings, header.get("k1", BM25_K1), header.get("b", BM25_B),
+                   doc_dates=header.get("doc_dates"), doc_artists=header.get("doc_artists"))
+
+
+# ── Per-collection helpers ──────────────────────────────────────
+
+_loaded: Dict[str, Tuple[float, BM25Index]] = {}
+
+
+def index_path(collection_name: str) -> str:
+    return os.path.join(LEXICAL_DIR, f"{collection_name}.bm25")
+
+
+def build_and_save(collection_name: str, ids: Sequence[str], texts: Sequence[str],
+                   metadatas: Optional[Sequence[dict]] = None) -> BM25Index:
+    """Build the BM25 index for one collection and write it next to Chroma."""
+    index = BM25Index.build(ids, texts, metadatas)
+    index.save(index_path(collection_name))
+    return index
+
+
+def build_from_collection(collection, batch: int = 5000) -> BM25Index:
+    """Build and save the index over everything stored in a Chroma collection.
+
+    Indexing only the chunks of the current run would let BM25 drift from
+    the vector store when a build adds to an existing collection."""
+    ids, texts, metadatas = [], [], []
+    for offset in range(0, collection.count(), batch):
+        page = collection.get(limit=batch, offset=offset, include=["documents", "metadatas"])
+        ids.extend(page["ids"])
+        texts.extend(doc or "" for doc in page["documents"])
+        metadatas.extend(m or {} for m in page["metadatas"])
+    return build_and_save(collection.name, ids, texts, metadatas)
+
+
+def load_index(collection_name: str) -> Optional[BM25Index]:
+    """Load (and cache) a collection's index; reloads when the file changes."""
+    path = index_path(collection_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _loaded.get(collection_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    index = BM25Index.load(path)
+    _loaded[collection_name] = (mtime, index)
+    return index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], k: int = RRF_K) -> Dict:
+    """Fuse several best-first rankings of hashable keys into RRF scores."""
+    fused: Dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return fused
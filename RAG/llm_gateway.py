@@ -0,0 +1,259 @@
+"""
+LLM gateway shared by every agent
+All calls to the Ollama server go through one bounded pool instead of the old
+per-request ``ollama_lock``, so concurrent websocket users are coordinated in
+one place:
+
+    * at most MAX_PARALLEL generations in flight (match OLLAMA_NUM_PARALLEL
+      on the Ollama server; extra requests would only queue there, blindly)
+    * priority classes: short calls on the critical path (rewrite, routing,
+      tool selection) are dispatched before summaries, summaries before
+      narratives
+    * within a class, sessions take turns (round robin), so one user's burst
+      of calls cannot starve another user
+    * reasoning control: deepseek-r1 writes a long <think> block before every
+      answer that nothing downstream uses.  Tasks not listed in THINK_TASKS
+      run with Ollama's ``think=False`` and skip it; listed tasks keep it and
+      the block is stripped from the returned text.  Tokens generated vs.
+      tokens actually used are tallied per task for /metrics.
+
+      langchain-ollama 0.3.3's OllamaLLM has no think/reasoning field; its
+      _generate_params merges extra call kwargs into the request, which is
+      how ``think`` reaches ollama's AsyncClient.generate.  THINK_FORWARDED
+      checks at import that the client takes ``think``, and every answer of
+      a think=False task is checked for a <think> block ("think_leaks" in
+      /metrics), so a dependency bump that drops it does not go unnoticed.
+
+Usage:
+    async with gateway.slot("summary", state.get("session_id")):
+        summary = await llm.ainvoke(prompt)
+"""
+
+import asyncio
+import inspect
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from ollama import AsyncClient
+
+from model_manager import tier_for
+
+# ── Config ──────────────────────────────────────────────────────
+MAX_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+# Lower class is dispatched first.
+PRIORITIES = {
+    "rewrite": 0,
+    "routing": 0,
+    "tool_selection": 0,
+    "summary": 1,
+    "narrative": 2,
+}
+DEFAULT_PRIORITY = 1
+
+# Tasks that keep the <think> phase, e.g. THINK_TASKS=summary,narrative
+THINK_TASKS = {t.strip() for t in os.getenv("THINK_TASKS", "").split(",") if t.strip()}
+THINK_FORWARDED = "think" in inspect.signature(AsyncClient.generate).parameters
+if not THINK_FORWARDED:
+    print("[llm_gateway] ollama client has no `think` parameter; reasoning cannot be skipped")
+
+
+def think_for(task: str) -> Optional[bool]:
+    """Ollama ``think`` value for *task*: False skips reasoning, None leaves it inline."""
+    return None if task in THINK_TASKS else False
+
+
+def strip_think(text: str) -> str:
+    """Answer text without the model's <think> block."""
+    if "</think>" in text:
+        return text.split("</think>", 1)[1].strip()
+    if text.lstrip().startswith("<think>"):
+        return ""  # cut off while still thinking
+    return text.strip()
+
+
+class LLMGateway:
+    def __init__(self, max_parallel: int = MAX_PARALLEL):
+        self.max_parallel = max(1, max_parallel)
+        self._active = 0
+        # priority -> session -> waiting futures; OrderedDict order is the round robin
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._tasks: Dict[str, Dict[str, float]] = {}
+
+    # ── Scheduling ──────────────────────────────────────────────
+
+    def _waiting(self) -> int:
+        return sum(len(q) for sessions in self._queues.values() for q in sessions.values())
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            while sessions:
+                session, waiters = next(iter(sessions.items()))
+                future = waiters.popleft()
+                if waiters:
+                    sessions.move_to_end(session)  # this session had its turn
+                else:
+                    del sessions[session]
+                if not future.cancelled():
+                    return future
+        return None
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_parallel:
+            future = self._next_waiter()
+            if future is None:
+                return
+            self._active += 1
+            future.set_result(None)
+
+    async def acquire(self, task: str, session_id: Optional[str] = None) -> float:
+        """Wait for a slot; returns the seconds spent queued."""
+        if self._active < self.max_parallel and not self._waiting():
+            self._active += 1
+            return 0.0
+        priority = PRIORITIES.get(task, DEFAULT_PRIORITY)
+        future = asyncio.get_running_loop().create_future()
+        sessions = self._queues.setdefault(priority, OrderedDict())
+        sessions.setdefault(session_id or "anonymous", deque()).append(future)
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # granted just before the cancel: hand it on
+            raise
+        return time.perf_counter() - start
+
+    def release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, task: str, session_id: Optional[str] = None):
+        waited = await self.acquire(task, session_id)
+        stats = self._task_stats(task)
+        stats["requests"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+        if waited > 0.5:
+            print(f"[llm_gateway] {task} for {session_id} queued {waited:.2f}s")
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats["run_total"] += time.perf_counter() - start
+            self.release()
+
+    # ── Metrics ─────────────────────────────────────────────────
+
+    def _task_stats(self, task: str) -> Dict[str, float]:
+        return self._tasks.setdefault(task, {
+            "requests": 0, "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0,
+            "tokens_generated": 0, "tokens_used": 0, "think_leaks": 0,
+        })
+
+    def check_think(self, task: str, text: str) -> None:
+        """Count (and report) a <think> block from a task that ran with think=False."""
+        if think_for(task) is False and "<think>" in text:
+            stats = self._task_stats(task)
+            stats["think_leaks"] += 1
+            if stats["think_leaks"] == 1:
+                print(f"[llm_gateway] {task} ran with think=False but returned a <think> block; "
+                      f"is `think` still forwarded to Ollama?")
+
+    def record_tokens(self, task: str, generated: Optional[int], text: str, used_text: str) -> None:
+        """Tally eval_count; the used share is estimated from the kept characters."""
+        if not generated:
+            return
+        stats = self._task_stats(task)
+        stats["tokens_generated"] += generated
+        stats["tokens_used"] += round(generated * len(used_text) / len(text)) if text else generated
+
+    def tier_stats(self) -> Dict:
+        """Call latency per model tier (see model_manager.TASK_TIERS)."""
+        tiers: Dict[str, Dict[str, float]] = {}
+        for task, s in self._tasks.items():
+            t = tiers.setdefault(tier_for(task), {"requests": 0, "run_total": 0.0})
+            t["requests"] += s["requests"]
+            t["run_total"] += s["run_total"]
+        for t in tiers.values():
+            t["run_avg"] = t["run_total"] / t["requests"] if t["requests"] else 0.0
+        return tiers
+
+    def stats(self) -> Dict:
+        depth = {}
+        for priority, sessions in self._queues.items():
+            n = sum(len(q) for q in sessions.values())
+            if n:
+                depth[priority] = n
+        return {
+            "max_parallel": self.max_parallel,
+            "in_flight": self._active,
+            "queued": sum(depth.values()),
+            "queued_by_priority": depth,
+            "tasks": {
+                task: {
+                    **s,
+                    "wait_avg": s["wait_total"] / s["requests"] if s["requests"] else 0.0,
+                    "run_avg": s["run_total"] / s["requests"] if s["requests"] else 0.0,
+                }
+                for task, s in self._tasks.items()
+            },
+            "tiers": self.tier_stats(),
+            "think_tasks": sorted(THINK_TASKS),
+            "think_forwarded": THINK_FORWARDED,
+        }
+
+
+gateway = LLMGateway()
+
+
+class _EvalCount(AsyncCallbackHandler):
+    """Reads Ollama's eval_count from the final generation."""
+
+    def __init__(self):
+        self.eval_count = None
+
+    async def on_llm_end(self, response, **kwargs) -> None:
+        info = response.generations[0][0].generation_info or {}
+        self.eval_count = info.get("eval_count")
+
+
+async def ainvoke(llm, prompt: str, task: str, session_id: Optional[str] = None) -> str:
+    """``llm.ainvoke(prompt)`` through the gateway, without the <think> block."""
+    usage = _EvalCount()
+    async with gateway.slot(task, session_id):
+        text = await llm.ainvoke(prompt, config={"callbacks": [usage]}, think=think_for(task))
+    gateway.check_think(task, text)
+    answer = strip_think(text)
+    gateway.record_tokens(task, usage.eval_count, text, answer)
+    return answer
+
+
+async def astream(llm, prompt: str, task: str, session_id: Optional[str] = None,
+                  emit: Optional[Callable[..., Awaitable]] = None) -> str:
+    """``llm.astream(prompt)`` through the gateway; returns the full answer
+    without the <think> block.
+
+    Each chunk is forwarded as ``await emit(task, delta)`` and the end of the
+    stage as ``await emit(task, "", done=True)``."""
+    usage = _EvalCount()
+    parts = []
+    async with gateway.slot(task, session_id):
+        async for delta in llm.astream(prompt, config={"callbacks": [usage]}, think=think_for(task)):
+            parts.append(delta)
+            if emit is not None:
+                await emit(task, delta)
+    if emit is not None:
+        await emit(task, "", done=True)
+    text = "".join(parts)
+    gateway.check_think(task, text)
+    answer = strip_think(text)
+    gateway.record_tokens(task, usage.eval_count, text, answer)
+    return answer
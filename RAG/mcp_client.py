@@ -0,0 +1,118 @@
+"""
+Shared async client for the RAG MCP API (rag_mcp_api.py, port 8002)
+One keep-alive connection pool for every agent and for summarization_agent's
+tool calls, instead of a blocking ``requests.post`` (and a fresh TCP
+connection) per call.  Blocking calls inside the async agents stalled the
+event loop, so the Send() fan-out ran the segment agents one after another.
+
+Transient failures (connection errors, a stale keep-alive connection, 502 /
+503 / 504) are retried with exponential backoff; timeouts are per path.
+
+Transports (MCP_TRANSPORT):
+    http       POST to rag_mcp_api over MCP_BASE_URL (split deployment)
+    inprocess  import rag_mcp_api and call /rag and the tool endpoint
+               functions directly in a worker thread, skipping JSON encoding
+               of the doc payloads and the HTTP round trip (single-host
+               deployment); /rag then returns RetrievalResult objects
+"""
+
+import asyncio
+import os
+import random
+from typing import Any, Dict, Optional
+
+import httpx
+
+import documents
+
+# ── Config ──────────────────────────────────────────────────────
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "http")
+MCP_BASE = os.getenv("MCP_BASE_URL", "http://localhost:8002")
+MCP_API = os.getenv("MCP_API_KEY")
+MAX_CONNECTIONS = int(os.getenv("MCP_MAX_CONNECTIONS", "16"))
+RETRIES = int(os.getenv("MCP_RETRIES", "2"))
+BACKOFF = 0.5  # seconds, doubled per retry
+# Per-path timeouts (s): geolocation also geocodes every place via Nominatim.
+PATH_TIMEOUTS = {
+    "/rag": 30.0,
+    "/geolocation_tool": 90.0,
+    "/sentiment_tool": 30.0,
+    "/ner_person_tool": 60.0,
+}
+DEFAULT_TIMEOUT = 30.0
+INPROCESS_PATHS = {"/rag", "/sentiment_tool", "/ner_person_tool", "/geolocation_tool"}
+RETRY_STATUS = {502, 503, 504}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+_client: Optional[httpx.AsyncClient] = None
+_routes: Optional[Dict[str, tuple]] = None
+
+
+def client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        headers = {"Content-Type": "application/json"}
+        if MCP_API:
+            headers["Authorization"] = f"Bearer {MCP_API}"
+        _client = httpx.AsyncClient(
+            base_url=MCP_BASE,
+            headers=headers,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+def _inprocess_routes() -> Dict[str, tuple]:
+    """path -> (request model, endpoint function) in rag_mcp_api."""
+    global _routes
+    if _routes is None:
+        import rag_mcp_api as api  # loads Chroma and the tool models
+        _routes = {
+            "/rag": (api.RAGRequest, api.rag_search),
+            "/sentiment_tool": (api.SentimentRequest, api.sentiment_tool_endpoint),
+            "/ner_person_tool": (api.NERRequest, api.ner_person_tool_endpoint),
+            "/geolocation_tool": (api.GeoRequest, api.geolocation_tool_endpoint),
+        }
+    return _routes
+
+
+def _call_inprocess(path: str, payload: Dict[str, Any]) -> Any:
+    request_model, endpoint = _inprocess_routes()[path]
+    return endpoint(request_model(**payload))
+
+
+async def post(path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+               transport: Optional[str] = None) -> Any:
+    """POST *payload* to *path* and return the decoded JSON body."""
+    timeout = timeout or PATH_TIMEOUTS.get(path, DEFAULT_TIMEOUT)
+    # in-process calls get the Doc objects as they are
+    if (transport or MCP_TRANSPORT) == "inprocess" and path in INPROCESS_PATHS:
+        # Same request models and endpoint functions as the HTTP app; the
+        # tools block on model inference, so keep them off the event loop.
+        # (No timeout: a running tool thread cannot be cancelled anyway.)
+        return await asyncio.to_thread(_call_inprocess, path, payload)
+    body = documents.dumps(payload)  # orjson encodes Doc objects natively
+    for attempt in range(RETRIES + 1):
+        try:
+            resp = await client().post(path, content=body, timeout=timeout)
+            if resp.status_code not in RETRY_STATUS or attempt == RETRIES:
+                resp.raise_for_status()
+                return resp.json()
+            reason = f"HTTP {resp.status_code}"
+        except RETRY_ERRORS as e:
+            if attempt == RETRIES:
+                raise
+            reason = repr(e)
+        delay = BACKOFF * (2 ** attempt) * (0.5 + random.random())
+        print(f"[mcp_client] {path} failed ({reason}); retry {attempt + 1}/{RETRIES} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,176 @@
+"""
+Model lifecycle manager for the Ollama models
+proxy_client1 used to build ``OllamaLLM(..., keep_alive=0)``, which unloads
+deepseek-r1 after every call, so each of the ~7 calls per query paid a full
+reload from disk.  Instead the manager:
+
+    * warms the models at FastAPI startup (an empty generate loads a model)
+    * pins them with MODEL_KEEP_ALIVE (-1 = until evicted)
+    * evicts the least recently used model only under memory pressure, when
+      MemAvailable in /proc/meminfo drops below MODEL_EVICT_MIN_AVAILABLE_MB
+    * counts loads / unloads and load latency for /metrics
+
+Tasks are assigned to model tiers: the short structured calls (rewrite,
+routing, tool selection) run on a small model, the summary and narrative
+on the reasoning model.  Every caller shares the manager's client.
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+from langchain_ollama.llms import OllamaLLM
+from ollama import AsyncClient
+
+# ── Config ──────────────────────────────────────────────────────
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+MODEL_TIERS = {
+    "small": os.getenv("SMALL_MODEL", "llama3.2:1b"),
+    "reasoning": os.getenv("REASONING_MODEL", "deepseek-r1:latest"),
+}
+TASK_TIERS = {
+    "rewrite": "small",
+    "routing": "small",
+    "tool_selection": "small",
+    "summary": "reasoning",
+    "narrative": "reasoning",
+}
+DEFAULT_MODEL = MODEL_TIERS["reasoning"]
+KEEP_ALIVE = os.getenv("MODEL_KEEP_ALIVE", "-1")
+MIN_AVAILABLE_MB = int(os.getenv("MODEL_EVICT_MIN_AVAILABLE_MB", "2048"))
+CHECK_INTERVAL = float(os.getenv("MODEL_PRESSURE_CHECK_INTERVAL", "30"))  # seconds
+
+
+def _keep_alive(value: str):
+    """Ollama accepts durations ("30m") or seconds; -1 keeps the model forever."""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def tier_for(task: str) -> str:
+    return TASK_TIERS.get(task, "reasoning")
+
+
+def model_for(task: str) -> str:
+    return MODEL_TIERS[tier_for(task)]
+
+
+def models_signature() -> str:
+    """Every task's model, e.g. for keying caches on all the models that shaped an answer."""
+    return ",".join(f"{task}={model_for(task)}" for task in sorted(TASK_TIERS)) + \
+        f",default={DEFAULT_MODEL}"
+
+
+def available_mb(path: str = "/proc/meminfo") -> Optional[int]:
+    """MemAvailable in MB, None where /proc/meminfo is missing."""
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        return None
+    return None
+
+
+class ModelManager:
+    def __init__(self, host: str = OLLAMA_HOST, keep_alive: str = KEEP_ALIVE,
+                 min_available_mb: int = MIN_AVAILABLE_MB):
+        self.host = host
+        self.keep_alive = _keep_alive(keep_alive)
+        self.min_available_mb = min_available_mb
+        self.client = AsyncClient(host=host)  # shared by every direct ollama call
+        self._llms: Dict[str, OllamaLLM] = {}
+        self._resident: Dict[str, float] = {}  # model -> last time seen loaded / used
+        self._watcher: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.unloads = 0
+        self.load_seconds: List[float] = []
+
+    def llm(self, model: str = DEFAULT_MODEL) -> OllamaLLM:
+        """Shared OllamaLLM for *model*, pinned with the configured keep_alive."""
+        if model not in self._llms:
+            self._llms[model] = OllamaLLM(model=model, base_url=self.host, keep_alive=self.keep_alive)
+        if model in self._resident:
+            self._resident[model] = time.monotonic()  # LRU order for eviction
+        return self._llms[model]
+
+    def llm_for(self, task: str) -> OllamaLLM:
+        return self.llm(model_for(task))
+
+    async def warm(self, models: List[str]) -> None:
+        for model in models:
+            start = time.perf_counter()
+            try:
+                await self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+            except Exception as e:
+                print(f"[model_manager] could not warm {model}: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            self.loads += 1
+            self.load_seconds.append(elapsed)
+            self._resident[model] = time.monotonic()
+            print(f"[model_manager] {model} loaded in {elapsed:.1f}s (keep_alive={self.keep_alive})")
+
+    async def evict(self, model: str) -> None:
+        await self.client.generate(model=model, prompt="", keep_alive=0)
+        self._resident.pop(model, None)
+        self.unloads += 1
+        print(f"[model_manager] evicted {model}")
+
+    async def _loaded_models(self) -> List[str]:
+        response = await self.client.ps()
+        return [m.model for m in response.models]
+
+    async def check_pressure(self) -> None:
+        """Track reloads done by the server and evict the LRU model when memory is short."""
+        loaded = await self._loaded_models()
+        for model in loaded:
+            if model not in self._resident:
+                # loaded again on demand after an eviction (or by another client)
+                self.loads += 1
+                self._resident[model] = time.monotonic()
+        for model in list(self._resident):
+            if model not in loaded:
+                self._resident.pop(model)
+        free = available_mb()
+        if free is not None and free < self.min_available_mb and self._resident:
+            lru = min(self._resident, key=self._resident.get)
+            print(f"[model_manager] {free} MB available < {self.min_available_mb} MB")
+            await self.evict(lru)
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_pressure()
+            except Exception as e:
+                print(f"[model_manager] pressure check failed: {e}")
+
+    async def start(self, models: List[str], interval: float = CHECK_INTERVAL) -> None:
+        await self.warm(models)
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(interval))
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def stats(self) -> Dict:
+        return {
+            "keep_alive": self.keep_alive,
+            "resident": sorted(self._resident),
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "load_seconds_last": self.load_seconds[-1] if self.load_seconds else None,
+            "load_seconds_avg": sum(self.load_seconds) / len(self.load_seconds) if self.load_seconds else None,
+            "available_mb": available_mb(),
+            "min_available_mb": self.min_available_mb,
+        }
+
+
+manager = ModelManager()
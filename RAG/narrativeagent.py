@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import Dict, List
 from langchain_ollama.llms import OllamaLLM
 from state import State
+import llm_gateway
 
 async def narrative_agent(state: State) -> Dict[str, str]:
     """
@@ -44,9 +45,8 @@ Your response should look something like this:
 
 """
     llm = state["llm"]
-    lock = state["ollama_lock"]
     print("[narrative_agent] Invoking LLM for narrative and recommendation...")
-    result = await llm.ainvoke(prompt)
+    result = await llm_gateway.astream(llm, prompt, "narrative", state.get("session_id"), state.get("emit"))
     print("[narrative_agent] LLM call complete")
 
     
@@ -7,11 +7,18 @@ from state import State
 from concurrent.futures import ThreadPoolExecutor
 import agent1, agent2, asyncio, summarizationagent, agent3, proxy_agent1
 import narrativeagent
+import tool_planner
+import query_rewrite
+import answer_cache
+import documents
+from llm_gateway import gateway
+import model_manager
 from langgraph.graph import StateGraph, START, END
 from langgraph.constants import Send
 from langchain_community.chat_models import ChatOllama
 import os
 import sys, json
+from contextlib import asynccontextmanager
 from datetime import datetime
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'Database'))
 from db_connection import get_secret
@@ -21,7 +28,15 @@ os.environ['LANGSMITH_ENDPOINT'] = langsmith_dict['LANGSMITH_ENDPOINT']
 os.environ['LANGSMITH_API_KEY'] = langsmith_dict['LANGSMITH_API_KEY']
 os.environ['LANGSMITH_PROJECT'] = langsmith_dict['LANGSMITH_PROJECT']
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm (and pin) every tier's model before the first query
+    await model_manager.manager.start(sorted(set(model_manager.MODEL_TIERS.values())))
+    yield
+    await model_manager.manager.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 def main():
@@ -40,8 +55,8 @@ app.add_middleware(
 )
 
 def proxy_agent2(state: State):
-    temp = "\n".join(state["response"])
-    return {"aggregated_response": temp}
+    # One doc list per segment agent -> a single flat list of Doc objects
+    return {"aggregated_response": [d for docs in state["response"] for d in docs]}
 
 
 def dummy(state: State):
@@ -92,26 +107,14 @@ orchestrator_worker_builder.add_edge("narrative_agent", END)
 orchestrator_worker = orchestrator_worker_builder.compile()
 # display(Image(orchestrator_worker.get_graph().draw_mermaid_png()))
 
-#keep alive=0 removes the cache 
-#can we do an if statement, connect to streamlit to toggle this?
-#keep_alive = true, 
-
-#llm = OllamaLLM(model="deepseek-r1:latest",api_base="https:/localhost:11434",keep_alive=-1)
-
-
-#llm = OllamaLLM(model="deepseek-r1:latest",api_base="https:/localhost:11434",keep_alive=0)
+_tables_ready = False
 
 
-def create_llm(mode):
-    if mode == "cache":
-        #keep alive -1 retains
-        print("cache")
-        return OllamaLLM(model="deepseek-r1:latest", api_base="http://localhost:11434", keep_alive=-1)
-    else:
-        print("not cache")
-        return OllamaLLM(model="deepseek-r1:latest", api_base="http://localhost:11434", keep_alive=0)
-
-def log_prompt_to_db(session_id, user_query, prompt, response, context):
+def log_prompt_to_db(session_id, user_query, prompt, response, context, tool_decisions=None):
+    """Write the prompt/response row and summarization_agent's tool choices
+    (tool_planner training data) over one connection.  Blocking: run it in a
+    thread from the websocket handler."""
+    global _tables_ready
     s_dict = get_secret("DB")
     user, password, host, port, dbname = s_dict['user'], s_dict[
         'password'], s_dict['host'], s_dict['port'], s_dict['dbname']
@@ -123,32 +126,61 @@ def log_prompt_to_db(session_id, user_query, prompt, response, context):
         port=port
     )
     print("Connected to db.")
-    cur = conn.cursor()
-    # Create table if it doesn't exist
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS prompts (
-            id SERIAL PRIMARY KEY,
-            session_id TEXT,
-            user_query TEXT,
-            prompt TEXT,
-            response TEXT,
-            context TEXT,
-            timestamp TIMESTAMPTZ DEFAULT NOW()
-        );
-    ''')
-    # Insert the prompt/response
-    cur.execute('''
-        INSERT INTO prompts (session_id, user_query, prompt, response, context, timestamp)
-        VALUES (%s, %s, %s, %s, %s, %s);
-    ''', (session_id, user_query, prompt, response, context, datetime.now()))
-    conn.commit()
-    print(" Prompt and response inserted into database.")
-    # print(response)
-    cur.close()
-    conn.close()
+    try:
+        with conn, conn.cursor() as cur:
+            # Create tables if they don't exist
+            if not _tables_ready:
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS prompts (
+                        id SERIAL PRIMARY KEY,
+                        session_id TEXT,
+                        user_query TEXT,
+                        prompt TEXT,
+                        response TEXT,
+                        context TEXT,
+                        timestamp TIMESTAMPTZ DEFAULT NOW()
+                    );
+                ''')
+                cur.execute(tool_planner.TOOL_DECISIONS_DDL)
+            # Insert the prompt/response
+            now = datetime.now()
+            cur.execute('''
+                INSERT INTO prompts (session_id, user_query, prompt, response, context, timestamp)
+                VALUES (%s, %s, %s, %s, %s, %s);
+            ''', (session_id, user_query, prompt, response, context, now))
+            if tool_decisions:
+                cur.executemany('''
+                    INSERT INTO tool_decisions (session_id, user_query, segment, tools, source, timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s);
+                ''', [(session_id, user_query, d["segment"], list(d["tools"]), d["source"], now)
+                      for d in tool_decisions])
+        _tables_ready = True
+        print(f" Prompt and response inserted into database "
+              f"(+{len(tool_decisions or [])} tool decisions).")
+    finally:
+        conn.close()
 
 recent_queries = {} 
 
+
+# Websocket protocol: token frames {"stage": "summary" | "narrative", "delta": str,
+# "done": bool} while the agents generate, then one {"stage": "final", "done": true,
+# "summary", "narrative/recommendation", "response"} frame with the full answer.
+def final_frame(answer: dict) -> str:
+    return json.dumps({"stage": "final", "done": True, **answer})
+
+
+@app.get("/metrics")
+def metrics():
+    """Cache hit rates and other runtime counters."""
+    return {
+        "rewrite_cache": query_rewrite.cache.stats(),
+        "answer_cache": answer_cache.cache.stats(),
+        "llm_gateway": gateway.stats(),
+        "models": model_manager.manager.stats(),
+    }
+
+
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(user_id: str, websocket: WebSocket):
     await websocket.accept()
@@ -179,7 +211,7 @@ async def websocket_endpoint(user_id: str, websocket: WebSocket):
                 
                 mode = b["mode"] 
                 query = b["query"]
-                llm = create_llm(mode)  
+                llm = model_manager.manager.llm_for("summary")
 
 
                 if user_id not in recent_queries:
@@ -189,7 +221,9 @@ async def websocket_endpoint(user_id: str, websocket: WebSocket):
                 recent_queries[user_id] = recent_queries[user_id][-3:] #last 3 
 
 
-                if mode == "cache":
+                # history only when there is some, so a first question keys the
+                # answer cache the same way in both modes
+                if mode == "cache" and len(recent_queries[user_id]) > 1:
                     prompt = "recent queries:\n"
                     print(prompt)
                     for pq in recent_queries[user_id][:-1]:  
@@ -199,14 +233,30 @@ async def websocket_endpoint(user_id: str, websocket: WebSocket):
                 else:
                     prompt = query
 
+                # "Use Cache" answers a repeated question from the answer cache;
+                # "Clear Cache" drops the stored answer and regenerates it.  Keyed on
+                # the text the graph runs on (with the recent queries) and all models.
+                models = model_manager.models_signature()
+                if mode == "cache":
+                    cached = answer_cache.cache.get(prompt, models)
+                    if cached is not None:
+                        print(f"[answer_cache] hit for '{query}' | {answer_cache.cache.stats()}")
+                        await websocket.send_text(final_frame(cached))
+                        continue
+                else:
+                    answer_cache.cache.evict(prompt, models)
+
+                async def emit(stage, delta, done=False):
+                    await websocket.send_text(json.dumps({"stage": stage, "delta": delta, "done": done}))
+
                 print("invoke")
                 # Call the orchestrator
                 #"query": prompt
-                state = await orchestrator_worker.ainvoke({"query": prompt, "session_id": user_id, "llm" : llm, "ollama_lock": asyncio.Lock(), "agents": None})
+                state = await orchestrator_worker.ainvoke({"query": prompt, "user_query": query, "session_id": user_id, "llm" : llm, "emit": emit, "agents": None})
                 summary = state.get("final_response", "")
                 narrative = state.get("narrative", "")
                 recommendation = state.get("recommendation", "")
-                responses = state.get("response", "")
+                responses = [documents.to_dicts(docs) for docs in state.get("response") or []]
                 # If the narrative or recommendation is missing, try to extract from the LLM output (handle 'Action:' as well)
                 if not narrative or not recommendation:
                     # Try to extract from the summary if present
@@ -228,16 +278,20 @@ async def websocket_endpoint(user_id: str, websocket: WebSocket):
                 # print(f"\n=== NARRATIVE ===\n{narrative}\n\n=== RECOMMENDATION ===\n{recommendation}\n")
                 dict = {"summary" : summary, "narrative/recommendation" : f"{narrative}\n{recommendation}", "response": responses}
                 response = json.dumps(dict)
+                answer_cache.cache.put(prompt, models, dict)
                 # Log prompt/response to DB
                 try:
                     prompt = state.get("prompt", [""])[
                         0] if "prompt" in state else ""
                     context = state.get("context", "")
-                    log_prompt_to_db(user_id, query, prompt, response, context)
+                    # Tool choices feed the tool_planner classifier (python tool_planner.py --train);
+                    # psycopg2 blocks, so keep it off the event loop
+                    await asyncio.to_thread(log_prompt_to_db, user_id, query, prompt, response,
+                                            context, state.get("tool_decisions"))
                 except Exception as e:
                     print(f"[DB LOGGING ERROR] {e}")
 
-                await websocket.send_text(response)
+                await websocket.send_text(final_frame(dict))
 
             except asyncio.TimeoutError:
                 print(f"No message. Keeping connection alive.")
@@ -0,0 +1,224 @@
+"""
+Quantized vector sidecar for the RAG system
+Chroma keeps every chunk as a float32 384-dim MiniLM vector (1.5 KB each) and
+has no option for smaller storage.  This file keeps a compact copy of each
+collection's vectors next to Chroma:
+
+    int8     per-dimension min/max scalar quantization, 384 B per vector
+    float16  half precision, 768 B per vector
+
+_rag (RAG_VECTOR_STORE=quantized) scans the compact copy for
+``n * RESCORE_FACTOR`` candidates, then fetches only those candidates' float32
+vectors from Chroma and rescores them exactly, so the final ranking and the
+reported distances are the same squared L2 as a Chroma query.  Collections
+without a sidecar are searched in Chroma as before.
+
+On-disk layout (one file per collection, ``<QUANT_DIR>/<collection>.npz``):
+    ids, codes, lo / scale (int8 only), norms (||decoded||^2), and the
+    chunks' ``date_ts`` / ``artist`` so the scan honours the same filters as
+    the Chroma `where` clause (as lexical_index does for BM25 hits).
+
+This trades disk for scan memory: it does not shrink ./chroma_storage (Chroma
+keeps its float32 vectors and HNSW index, and the rescore reads from them),
+so total disk grows by the sidecar (~25% for int8, ~50% for float16).  What
+shrinks is the vector data a query scans.
+
+Build with QUANTIZED_DTYPE=int8|float16 (default none); measure scan memory,
+disk (Chroma + sidecar) and recall with ``python benchmarks.py quantized``.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ── Config ──────────────────────────────────────────────────────
+QUANT_DIR = os.getenv("QUANTIZED_INDEX_DIR", "./quantized_index")
+QUANT_DTYPE = os.getenv("QUANTIZED_DTYPE", "none")  # build option: int8 | float16 | none
+VECTOR_STORE = os.getenv("RAG_VECTOR_STORE", "chroma")  # query time: chroma | quantized
+RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "4"))
+DTYPES = ("int8", "float16")
+BLOCK = 16384  # rows decoded at a time while scanning
+BATCH = 5000  # embeddings read per get() while building
+
+
+class QuantizedIndex:
+    """Brute-force squared-L2 search over int8 or float16 vectors."""
+
+    def __init__(self, ids: np.ndarray, codes: np.ndarray, norms: np.ndarray,
+                 lo: Optional[np.ndarray] = None, scale: Optional[np.ndarray] = None,
+                 dates: Optional[np.ndarray] = None, artists: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.codes = codes
+        self.norms = norms
+        self.lo = lo
+        self.scale = scale
+        self.dates = dates if dates is not None else np.full(len(ids), np.nan)
+        self.artists = artists if artists is not None else np.full(len(ids), "")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dtype(self) -> str:
+        return str(self.codes.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the vectors and per-row norms (ids/filters excluded)."""
+        extra = sum(a.nbytes for a in (self.lo, self.scale) if a is not None)
+        return self.codes.nbytes + self.norms.nbytes + extra
+
+    @classmethod
+    def build(cls, ids: Sequence[str], embeddings, metadatas: Optional[Sequence[dict]] = None,
+              dtype: str = "int8") -> "QuantizedIndex":
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown quantized dtype {dtype!r} (expected one of {DTYPES})")
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        lo = scale = None
+        if dtype == "int8":
+            lo = vectors.min(axis=0)
+            scale = np.maximum((vectors.max(axis=0) - lo) / 255.0, 1e-12).astype(np.float32)
+            codes = (np.rint((vectors - lo) / scale) - 128).astype(np.int8)
+        else:
+            codes = vectors.astype(np.float16)
+        index = cls(np.asarray(ids, dtype=str), codes, np.zeros(len(ids), np.float32), lo, scale)
+        for start in range(0, len(ids), BLOCK):
+            decoded = index._decode(start, start + BLOCK)
+            index.norms[start:start + BLOCK] = np.einsum("ij,ij->i", decoded, decoded)
+        metadatas = metadatas or [{}] * len(ids)
+        index.dates = np.array([np.nan if m.get("date_ts") is None else m["date_ts"]
+                                for m in metadatas], dtype=np.float64)
+        index.artists = np.array([m.get("artist") or "" for m in metadatas], dtype=str)
+        return index
+
+    def _decode(self, start: int, stop: int) -> np.ndarray:
+        block = self.codes[start:stop].astype(np.float32)
+        if self.lo is not None:
+            block = (block + 128.0) * self.scale + self.lo
+        return block
+
+    def _mask(self, date_from: Optional[int], date_to: Optional[int],
+              artist: Optional[str]) -> Optional[np.ndarray]:
+        if date_from is None and date_to is None and artist is None:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        if artist is not None:
+            mask &= self.artists == artist
+        if date_from is not None:
+            mask &= self.dates >= date_from  # NaN (undated) compares False
+        if date_to is not None:
+            mask &= self.dates <= date_to
+        return mask
+
+    def search(self, query_emb, top_k: int = 5, date_from: Optional[int] = None,
+               date_to: Optional[int] = None, artist: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Return up to *top_k* (chunk_id, approximate squared L2) pairs, closest first."""
+        if not len(self.ids) or top_k <= 0:
+            return []
+        q = np.asarray(query_emb, dtype=np.float32)
+        dists = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), BLOCK):
+            dots = self._decode(start, start + BLOCK) @ q
+            dists[start:start + BLOCK] = self.norms[start:start + BLOCK] - 2.0 * dots
+        dists += float(q @ q)
+        mask = self._mask(date_from, date_to, artist)
+        if mask is not None:
+            dists[~mask] = np.inf
+        top_k = min(top_k, int(np.isfinite(dists).sum()))
+        if not top_k:
+            return []
+        best = np.argpartition(dists, top_k - 1)[:top_k]
+        best = best[np.argsort(dists[best])]
+        return [(str(self.ids[i]), float(dists[i])) for i in best]
+
+    # ── Persistence ─────────────────────────────────────────────
+
+    def save(self, path: str) -> None:
+        arrays = {"ids": self.ids, "codes": self.codes, "norms": self.norms,
+                  "dates": self.dates, "artists": self.artists}
+        if self.lo is not None:
+            arrays.update(lo=self.lo, scale=self.scale)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        return cls(arrays["ids"], arrays["codes"], arrays["norms"], arrays.get("lo"),
+                   arrays.get("scale"), arrays.get("dates"), arrays.get("artists"))
+
+
+# ── Per-collection helpers ──────────────────────────────────────
+
+_loaded: Dict[str, Tuple[float, QuantizedIndex]] = {}
+
+
+def index_path(collection_name: str) -> str:
+    return os.path.join(QUANT_DIR, f"{collection_name}.npz")
+
+
+def read_collection(collection) -> Tuple[List[str], np.ndarray, List[dict]]:
+    """(ids, float32 embeddings, metadatas) of a whole Chroma collection."""
+    ids, embeddings, metadatas = [], [], []
+    for offset in range(0, collection.count(), BATCH):
+        page = collection.get(limit=BATCH, offset=offset, include=["embeddings", "metadatas"])
+        ids.extend(page["ids"])
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+        metadatas.extend(m or {} for m in page["metadatas"])
+    vectors = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), np.float32)
+    return ids, vectors, metadatas
+
+
+def build_and_save(collection, dtype: str = QUANT_DTYPE) -> Optional[QuantizedIndex]:
+    """Quantize one Chroma collection's stored vectors and write the sidecar."""
+    if dtype not in DTYPES:
+        return None
+    ids, vectors, metadatas = read_collection(collection)
+    if not ids:
+        return None
+    index = QuantizedIndex.build(ids, vectors, metadatas, dtype)
+    index.save(index_path(collection.name))
+    return index
+
+
+def load_index(collection_name: str) -> Optional[QuantizedIndex]:
+    """Load (and cache) a collection's sidecar; reloads when the file changes."""
+    path = index_path(collection_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _loaded.get(collection_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    index = QuantizedIndex.load(path)
+    _loaded[collection_name] = (mtime, index)
+    return index
+
+
+def rescore(collection, hits: List[Tuple[str, float]], query_emb, top_k: int) -> List[Tuple[str, float]]:
+    """Exact float32 squared L2 for quantized *hits* (one Chroma get), closest *top_k*."""
+    if not hits:
+        return []
+    got = collection.get(ids=[cid for cid, _ in hits], include=["embeddings"])
+    vectors = np.asarray(got["embeddings"], dtype=np.float32)
+    diff = vectors - np.asarray(query_emb, dtype=np.float32)
+    dists = np.einsum("ij,ij->i", diff, diff)
+    order = np.argsort(dists)[:top_k]
+    return [(got["ids"][i], float(dists[i])) for i in order]
+
+
+def search(collection, query_emb, top_k: int, filters: Optional[dict] = None,
+           rescore_factor: int = RESCORE_FACTOR) -> Optional[List[Tuple[str, float]]]:
+    """Quantized scan + float32 rescore; None when the collection has no sidecar."""
+    index = load_index(collection.name)
+    if index is None:
+        return None
+    hits = index.search(query_emb, top_k * max(1, rescore_factor), **(filters or {}))
+    if rescore_factor <= 0:
+        return hits[:top_k]
+    return rescore(collection, hits, query_emb, top_k)
@@ -0,0 +1,185 @@
+"""
+Shared query-rewrite stage
+One structured-output LLM call rewrites the user question into a search
+string for each segment agent (community, news, music); the results are
+cached and fanned out to the agents through ``state["opt_queries"]``.
+
+Rephrasings of a recent question ("SZA tour merch" / "SZA merch sizing at
+concerts") reuse its rewrite through the embedding near-match in
+RewriteCache instead of paying for another generation.
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from artists import detect_artists
+from llm_gateway import gateway, strip_think, think_for
+from model_manager import manager, model_for
+
+# ── Config ──────────────────────────────────────────────────────
+REWRITE_MODEL = model_for("rewrite")
+CACHE_SIZE = 256
+CACHE_TTL = float(os.getenv("REWRITE_CACHE_TTL", "3600"))  # seconds
+SIMILARITY_THRESHOLD = float(os.getenv("REWRITE_CACHE_SIMILARITY", "0.85"))
+EMBED_MODEL = "all-MiniLM-L6-v2"
+SEGMENTS = ("community", "news", "music")
+
+
+class Rewrites(BaseModel):
+    reasoning: str
+    community: str
+    news: str
+    music: str
+
+
+SYSTEM_PROMPT = (
+    "Query Rewriter\n"
+    "You are provided with the user's current question *and* possibly their previous queries. "
+    "Convert the question about a public figure into THREE plain search sentences, one per source:\n"
+    "  • community: how fans and social media (Reddit, forums, Twitter) would phrase it.\n"
+    "  • news: how news outlets and entertainment media would report it.\n"
+    "  • music: the industry side – releases, charts, tours, venues, dates, business.\n"
+    "Rules for every rewritten sentence:\n"
+    "  • Begin with the person’s full name in double quotes. This is incredibly important, include their name first\n"
+    "  • Add 2–4 meaning-bearing words from the question and, if relevant, keywords or context from the previous queries. Drop filler words.\n"
+    "  • Use spaces only—no punctuation, Boolean words, or extra text.\n"
+    "If the new question is similar to recent queries, make the rewrites more specific to avoid redundancy.\n"
+    "Output format (as valid JSON):\n"
+    "{"
+    "  \"reasoning\": \"<one or two sentences>\","
+    "  \"community\": \"<search sentence>\","
+    "  \"news\": \"<search sentence>\","
+    "  \"music\": \"<search sentence>\""
+    "}\n"
+    "Reply with exactly that JSON object and nothing else."
+)
+
+
+class RewriteCache:
+    """Rewrite cache keyed by normalized query, with TTL and near-match lookup.
+
+    A miss on the exact key falls back to cosine similarity against the
+    embeddings of the cached queries (a brute-force in-memory index; the cache
+    holds at most CACHE_SIZE entries).  A near match is only reused when it
+    names the same artists, since every rewrite starts with the artist's name.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 threshold: float = SIMILARITY_THRESHOLD):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        # key -> (rewrites, created_at, unit embedding, artists)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._matrix = None  # stacked embeddings, rebuilt lazily
+        self._keys: list = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        stale = [k for k, e in self._entries.items() if now - e[1] > self.ttl]
+        for k in stale:
+            del self._entries[k]
+        if stale:
+            self._matrix = None
+
+    def get(self, key: str, embedding=None) -> Optional[Dict[str, str]]:
+        """Cached rewrites for *key*.  Without *embedding* this is a cheap exact
+        probe; misses are only counted on the lookup that has the embedding."""
+        self._expire()
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return dict(self._entries[key][0])
+        if embedding is None:
+            return None
+        if self._entries:
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[k][2] for k in self._keys])
+            sims = self._matrix @ embedding
+            best = int(np.argmax(sims))
+            match = self._entries[self._keys[best]]
+            if sims[best] >= self.threshold and match[3] == detect_artists(key):
+                self.semantic_hits += 1
+                print(f"[query_rewrite] near match ({sims[best]:.3f}) for '{key}': '{self._keys[best]}'")
+                return dict(match[0])
+        self.misses += 1
+        return None
+
+    def put(self, key: str, rewrites: Dict[str, str], embedding) -> None:
+        self._entries[key] = (dict(rewrites), time.monotonic(), embedding, detect_artists(key))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+cache = RewriteCache()
+_embedder = None
+
+
+def _embed(text: str):
+    global _embedder
+    if _embedder is None:
+        from sentence_transformers import SentenceTransformer
+        _embedder = SentenceTransformer(EMBED_MODEL)
+    return _embedder.encode(text, normalize_embeddings=True)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+
+async def _generate(query: str, session_id: Optional[str] = None) -> Dict[str, str]:
+    async with gateway.slot("rewrite", session_id):
+        response = await manager.client.chat(
+            model=REWRITE_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"User question: {query}"},
+            ],
+            format=Rewrites.model_json_schema(),
+            keep_alive=manager.keep_alive,
+            think=think_for("rewrite"),
+        )
+    content = response.message.content
+    used = strip_think(content)
+    gateway.record_tokens("rewrite", response.eval_count, content, used)
+    result = Rewrites.model_validate_json(used)
+    return {segment: getattr(result, segment).strip() for segment in SEGMENTS}
+
+
+async def rewrite_queries(query: str, session_id: Optional[str] = None) -> Dict[str, str]:
+    """Per-segment search strings for *query*: {"community", "news", "music"}."""
+    key = normalize_query(query)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    embedding = await asyncio.to_thread(_embed, key)
+    cached = cache.get(key, embedding)
+    if cached is not None:
+        return cached
+    rewrites = await _generate(query, session_id)
+    cache.put(key, rewrites, embedding)
+    print(f"[query_rewrite] {rewrites} | cache {cache.stats()}")
+    return dict(rewrites)
@@ -1,7 +1,18 @@
 from fastapi import FastAPI, Request
-from pydantic import BaseModel
-import requests
+from pydantic import BaseModel, field_validator
 from test_chromd import setup_chroma
+from chromadb.utils import embedding_functions
+import numpy as np
+import lexical_index
+import distance_calibration
+import collection_router
+import quantized_index
+from documents import RetrievalResult, materialize
+import retrieval_hooks
+import reranker
+from artists import normalize_artist
+from dateutil import parser as date_parser
+import calendar
 
 from collections import Counter
 from transformers import pipeline
@@ -18,8 +29,6 @@ except OSError:
     print("spaCy model not found. Please run: python -m spacy download en_core_web_sm")
     nlp = None
 
-MCP_URL = "http://localhost:8002/query"
-
 app = FastAPI()
 chroma_client = setup_chroma()
 
@@ -44,23 +53,149 @@ class RAGRequest(BaseModel):
     query: str
     collections: list[str] | None = None   # falls back to ALL_COLLECTIONS
     top_k: int = 5 #not used but dont take out
+    hybrid: bool = True  # fuse BM25 hits with vector hits (RRF)
+    # Pushed down into the vector search as a Chroma `where` clause
+    date_from: str | int | None = None  # ISO date or epoch seconds, inclusive
+    date_to: str | int | None = None    # ISO date or epoch seconds, inclusive
+    artist: str | None = None           # name or canonical key, e.g. "SZA"
+    # Cross-encoder rerank of `candidates` hits per collection (default RAG_RERANK)
+    rerank: bool | None = None
+    candidates: int | None = None       # per collection; default top_k, or RERANK_CANDIDATES
+    # Probe only the collections the router picks (default RAG_ROUTE)
+    route: bool | None = None
+
+    @field_validator("date_from", "date_to")
+    @classmethod
+    def _parse_date(cls, value):
+        """Normalize to epoch seconds here, so a bad date is a 422 rather than a 500."""
+        try:
+            return _to_epoch(value)
+        except (ValueError, OverflowError) as e:
+            raise ValueError(f"unparseable date {value!r}: {e}") from None
+
+# Same MiniLM embedder Chroma uses by default, so the query is embedded once
+# per request instead of once per collection.
+query_embedder = embedding_functions.DefaultEmbeddingFunction()
+
+
+def _squared_l2(a, b) -> float:
+    """Chroma's default "l2" space reports squared euclidean distance."""
+    diff = np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32)
+    return float(np.dot(diff, diff))
+
+
+def _to_epoch(value) -> int | None:
+    """Epoch seconds for an ISO date string (or pass through an int)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    return calendar.timegm(date_parser.parse(value).utctimetuple())
+
+
+def build_filters(date_from=None, date_to=None, artist=None) -> dict:
+    """Normalize request filters to {date_from, date_to, artist} (epoch ints, artist key)."""
+    return {
+        "date_from": _to_epoch(date_from),
+        "date_to": _to_epoch(date_to),
+        "artist": normalize_artist(artist) if artist else None,
+    }
+
+
+def build_where(filters: dict) -> dict | None:
+    """Chroma `where` clause over the numeric `date_ts` and `artist` metadata."""
+    clauses = []
+    if filters.get("date_from") is not None:
+        clauses.append({"date_ts": {"$gte": filters["date_from"]}})
+    if filters.get("date_to") is not None:
+        clauses.append({"date_ts": {"$lte": filters["date_to"]}})
+    if filters.get("artist"):
+        clauses.append({"artist": filters["artist"]})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _lexical_candidates(coll, name: str, query: str, query_emb, top_k: int,
+                        results: dict, filters: dict) -> list:
+    """BM25 hits for one collection; fetches chunks the vector search missed."""
+    index = lexical_index.load_index(name)
+    if index is None:
+        return []
+    hits = index.search(query, top_k, **filters)
+    missing = [cid for cid, _ in hits if (name, cid) not in results]
+    if missing:
+        # only the embedding is needed to score; text/metadata load after ranking
+        got = coll.get(ids=missing, include=["embeddings"])
+        for cid, emb in zip(got["ids"], got["embeddings"]):
+            results[(name, cid)] = RetrievalResult(name, cid, _squared_l2(query_emb, emb))
+    ranked = []
+    for cid, score in hits:
+        key = (name, cid)
+        if key in results:
+            results[key].bm25 = score
+            ranked.append((key, score))
+    return ranked
+
+def _vector_ranking(results: dict, collections: list[str]) -> list:
+    """Vector hits of all collections, best first, on a common scale.
+
+    Raw distances are only comparable within a collection.  Hits of
+    collections with build-time calibration are merged on the z-score of
+    their distance (and ``distance_z`` is set); each uncalibrated collection
+    (e.g. one too small to calibrate) keeps its own ranking, and those are
+    fused with the calibrated ranking by rank."""
+    calibration = {name: distance_calibration.stats_for(name) for name in collections}
+    calibrated = []
+    per_collection = {name: [] for name in collections if not calibration[name]}
+    for key in sorted(results, key=lambda k: results[k].distance):
+        stats = calibration.get(key[0])
+        if stats:
+            results[key].distance_z = distance_calibration.z_score(results[key].distance, stats)
+            calibrated.append(key)
+        else:
+            per_collection[key[0]].append(key)
+    calibrated.sort(key=lambda k: results[k].distance_z)
+    if not per_collection:
+        return calibrated
+    print(f"[rag] no distance calibration for {list(per_collection)}; merging them by rank")
+    fused = lexical_index.reciprocal_rank_fusion([calibrated, *per_collection.values()])
+    return sorted(fused, key=lambda k: -fused[k])
 
 #also just dont take out
-def _rag(query: str, collections: list[str], top_k: int):
-    """Run a vector search on the given collections and hit MCP."""
-    all_results = []
+def _rag(query: str, collections: list[str], top_k: int, hybrid: bool = True,
+         filters: dict | None = None, rerank: bool = False, candidates: int | None = None,
+         route: bool = False):
+    """Run a hybrid (vector + BM25) search on the given collections, then the
+    post-retrieval hook chain (retrieval_hooks; a no-op unless hooks are registered).
+
+    With *rerank*, each collection contributes *candidates* hits and the fused
+    pool (up to RERANK_MAX_PAIRS) is reordered by the cross-encoder.  With
+    *route*, only the collections collection_router picks are searched."""
+    filters = filters or build_filters()
+    where = build_where(filters)
+    per_collection = candidates or (reranker.RERANK_CANDIDATES if rerank else top_k)
+    query_emb = query_embedder([query])[0]
+    if route:
+        collections = collection_router.route(query, query_emb, collections, filters.get("artist"))
+    results = {}        # (collection, chunk id) -> RetrievalResult
+    lexical_hits = []   # ((collection, chunk id), bm25 score)
     for name in collections:
         coll = chroma_client.get_collection(name)
-        res  = coll.query(query_texts=[query], n_results=top_k)
-        for doc, meta, dist in zip(res["documents"][0],
-                                   res["metadatas"][0],
-                                   res["distances"][0]):
-            all_results.append({
-                "source":   name,
-                "document": doc,
-                "metadata": meta,
-                "distance": dist,
-            })
+        hits = None
+        if quantized_index.VECTOR_STORE == "quantized":
+            # int8/float16 scan, float32 rescore of the candidates (None: no sidecar)
+            hits = quantized_index.search(coll, query_emb, per_collection, filters)
+        if hits is None:
+            # ids + distances only; text/metadata are loaded for the final top_k
+            res  = coll.query(query_embeddings=[query_emb], n_results=per_collection, where=where,
+                              include=["distances"])
+            hits = zip(res["ids"][0], res["distances"][0])
+        for cid, dist in hits:
+            results[(name, cid)] = RetrievalResult(name, cid, dist)
+        if hybrid:
+            lexical_hits.extend(
+                _lexical_candidates(coll, name, query, query_emb, per_collection, results, filters))
 
     #get closest to now 
     
@@ -69,24 +204,45 @@ def _rag(query: str, collections: list[str], top_k: int):
     #     recency = get_date_score(result["metadata"])
     #     return result["distance"] - alpha * recency
     # all_results.sort(key=recency_weighted_score)
-    all_results.sort(key=lambda r: r["distance"])
-    top = all_results[:top_k]
-    context = "\n".join(r["document"] for r in top)
-
-    mcp_resp = requests.post(
-        MCP_URL, json={"query": query, "context": context}
-    ).json()
-
-    return {"mcp_result": mcp_resp, "rag_context": context, "results": top}
+    vector_ranking = _vector_ranking(results, collections)
+    if lexical_hits:
+        lexical_ranking = [k for k, _ in sorted(lexical_hits, key=lambda h: -h[1])]
+        fused = lexical_index.reciprocal_rank_fusion([vector_ranking, lexical_ranking])
+        for key, score in fused.items():
+            results[key].rrf_score = score
+        ranking = sorted(fused, key=lambda k: -fused[k])
+    else:
+        ranking = vector_ranking
+    pool = ranking[:reranker.RERANK_MAX_PAIRS] if rerank else ranking[:top_k]
+    top = materialize([results[k] for k in pool], chroma_client.get_collection)
+    before = [reranker.rerank] if rerank else []
+    top = retrieval_hooks.run(query, top, top_k, before)[:top_k]
+    context = "\n".join(r.document for r in top)
+
+    return {"hooks": retrieval_hooks.hook_names(), "collections": collections,
+            "rag_context": context, "results": top}
 
 @app.get("/collections")
 def list_collections():
     return {"collections": ALL_COLLECTIONS}
 
+@app.get("/metrics")
+def metrics():
+    return {"rerank_cache": reranker.cache.stats(), "router": collection_router.stats()}
+
+def rag_search(req: RAGRequest):
+    """/rag with RetrievalResult objects (used directly by the in-process transport)."""
+    chosen = req.collections or ALL_COLLECTIONS
+    filters = build_filters(req.date_from, req.date_to, req.artist)
+    rerank = reranker.RERANK_DEFAULT if req.rerank is None else req.rerank
+    route = collection_router.ROUTE_DEFAULT if req.route is None else req.route
+    return _rag(req.query, chosen, req.top_k, req.hybrid, filters, rerank, req.candidates, route)
+
 @app.post("/rag")
 def rag_endpoint(req: RAGRequest):
-    chosen = req.collections or ALL_COLLECTIONS
-    return _rag(req.query, chosen, req.top_k)
+    out = rag_search(req)
+    out["results"] = [r.to_dict() for r in out["results"]]
+    return out
 #hello
 #most used words, maybe change this to do something more useful
 def trend_tool(collection_name: str):
@@ -107,12 +263,9 @@ transformer_sentiment_analyzer = pipeline("sentiment-analysis", model="distilber
 def sentiment_tool(docs: list):
     documents = []
     for doc in docs:
-        print(doc)
-        print(type(doc))
         collection = chroma_client.get_collection(doc.get("source"))
         res = collection.get(where={'original_id': doc.get("metadata").get("original_id")})
         documents.extend(res.get("documents", []))
-    print(documents)
     results = transformer_sentiment_analyzer(documents)
     # Return the positive class probability as the sentiment score
     return [r["score"] if r["label"] == "POSITIVE" else -r["score"] for r in results]
@@ -0,0 +1,110 @@
+"""
+Cross-encoder reranking for rag_mcp_api._rag
+Per-collection L2 distances are not comparable across collections, so the
+vector/BM25 fusion only gives a rough candidate order.  With reranking on,
+_rag fetches RERANK_CANDIDATES hits per collection and this stage scores the
+(query, chunk) pairs with a small cross-encoder on CPU, in batches, keeping
+the top_k by score.
+
+Pair scores are cached (LRU) on (normalized query, collection, chunk id), so
+repeated and paginated queries only score new chunks.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+# ── Config ──────────────────────────────────────────────────────
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_DEFAULT = os.getenv("RAG_RERANK", "0") == "1"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # per collection
+RERANK_MAX_PAIRS = int(os.getenv("RERANK_MAX_PAIRS", "200"))  # cap on pairs scored per query
+BATCH_SIZE = int(os.getenv("RERANK_BATCH", "32"))
+CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "8192"))
+MAX_CHARS = 2000  # the model truncates at 512 tokens anyway
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _cross_encoder():
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+            _model = CrossEncoder(RERANK_MODEL, device="cpu")
+    return _model
+
+
+class PairScoreCache:
+    """Thread-safe LRU of cross-encoder scores (FastAPI runs /rag in a threadpool)."""
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self._scores: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], float]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    found[key] = self._scores[key]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores: Dict[Tuple[str, str, str], float]) -> None:
+        with self._lock:
+            self._scores.update(scores)
+            for key in scores:
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._scores), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+cache = PairScoreCache()
+
+
+def _normalize(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+
+def rerank(query: str, results: list, top_k: int) -> list:
+    """Sort RetrievalResult hits by cross-encoder score (sets ``rerank_score``).
+
+    Same signature as a retrieval_hooks hook."""
+    if not results:
+        return results
+    start = time.perf_counter()
+    q = _normalize(query)
+    keys = [(q, r.source, r.chunk_id) for r in results]
+    scores = cache.get_many(keys)
+    todo = [i for i, key in enumerate(keys) if key not in scores]
+    if todo:
+        pairs = [(query, (results[i].document or "")[:MAX_CHARS]) for i in todo]
+        predicted = _cross_encoder().predict(pairs, batch_size=BATCH_SIZE, show_progress_bar=False)
+        new = {keys[i]: float(s) for i, s in zip(todo, predicted)}
+        cache.put_many(new)
+        scores.update(new)
+    for r, key in zip(results, keys):
+        r.rerank_score = scores[key]
+    ranked = sorted(results, key=lambda r: -r.rerank_score)
+    print(f"[reranker] {len(results)} pairs ({len(todo)} scored) in "
+          f"{time.perf_counter() - start:.3f}s -> top {top_k}")
+    return ranked
@@ -0,0 +1,72 @@
+"""
+Post-retrieval hook chain for rag_mcp_api._rag
+After ranking, _rag hands the materialized hits to every registered hook in
+order.  A hook is a plain function
+
+    hook(query: str, results: list[RetrievalResult], top_k: int) -> list[RetrievalResult]
+
+that may rerank, drop, compress or annotate the hits; the chain is empty by
+default, so retrieval ends with no extra work.  (It used to end with a
+blocking POST to rag_mcp_api's own /query echo endpoint.)
+
+External MCP servers are notified through ExternalMCPHook, which posts the
+query and context from a background thread and never holds up the response.
+Set RAG_EXTERNAL_MCP_URL to enable one.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import httpx
+
+# ── Config ──────────────────────────────────────────────────────
+EXTERNAL_MCP_URL = os.getenv("RAG_EXTERNAL_MCP_URL")
+EXTERNAL_MCP_TIMEOUT = float(os.getenv("RAG_EXTERNAL_MCP_TIMEOUT", "10"))
+
+Hook = Callable[[str, list, int], list]
+
+_hooks: List[Hook] = []
+
+
+def register(hook: Hook) -> Hook:
+    """Append *hook* to the chain (usable as a decorator)."""
+    _hooks.append(hook)
+    return hook
+
+
+def run(query: str, results: list, top_k: int, before: List[Hook] = ()) -> list:
+    """Run the per-request hooks in *before*, then the registered chain."""
+    for hook in [*before, *_hooks]:
+        results = hook(query, results, top_k)
+    return results
+
+
+def hook_names() -> List[str]:
+    return [getattr(h, "__name__", type(h).__name__) for h in _hooks]
+
+
+class ExternalMCPHook:
+    """Fire-and-forget notification of an external MCP server; results pass through."""
+
+    def __init__(self, url: str, timeout: float = EXTERNAL_MCP_TIMEOUT, workers: int = 2):
+        self.url = url
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mcp-hook")
+        self._client = httpx.Client(timeout=timeout)
+        self.__name__ = f"external_mcp({url})"
+
+    def _post(self, query: str, context: str) -> None:
+        try:
+            self._client.post(self.url, json={"query": query, "context": context})
+        except Exception as e:
+            print(f"[retrieval_hooks] external MCP {self.url} failed: {e!r}")
+
+    def __call__(self, query: str, results: list, top_k: int) -> list:
+        context = "\n".join(r.document or "" for r in results[:top_k])
+        self._executor.submit(self._post, query, context)
+        return results
+
+
+if EXTERNAL_MCP_URL:
+    register(ExternalMCPHook(EXTERNAL_MCP_URL))
@@ -0,0 +1,196 @@
+"""
+Corpus-wide sentiment aggregates per artist
+Background job that scores every chunk in every Chroma collection once (the
+score is written back into the chunk's metadata as ``sentiment``) and then
+materializes a compact table of per-(artist, source, day) sentiment
+aggregates: count, sum and sum of squares.
+
+Any bin width is a sum over days, so summarization_agent can rebuild the
+artist's trend line for ``bin_days`` from config.json in O(bins) without
+touching the documents.
+
+Run once after building the vector db, or keep it running:
+    python sentiment_aggregates.py                  # one pass
+    python sentiment_aggregates.py --interval 3600  # re-run every hour
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from date_normalization import BIN_ANCHOR_TS, DAY_SECONDS
+from sentiment_timeseries import BinnedSeries
+
+# ── Config ──────────────────────────────────────────────────────
+AGGREGATES_PATH = os.getenv("SENTIMENT_AGGREGATES_PATH", "./sentiment_aggregates.npz")
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+PAGE_SIZE = 1000
+SCORE_BATCH = 32
+
+
+# ── Scoring ─────────────────────────────────────────────────────
+
+_analyzer = None
+
+
+def _sentiment_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        from transformers import pipeline
+        _analyzer = pipeline("sentiment-analysis", model=SENTIMENT_MODEL)
+    return _analyzer
+
+
+def score_texts(texts: List[str]) -> List[float]:
+    """Signed sentiment per text: +p(POSITIVE) or -p(NEGATIVE), as sentiment_tool does."""
+    results = _sentiment_analyzer()(texts, batch_size=SCORE_BATCH, truncation=True)
+    return [r["score"] if r["label"] == "POSITIVE" else -r["score"] for r in results]
+
+
+def _iter_chunks(collection) -> Iterable[Tuple[List[str], List[str], List[dict]]]:
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            return
+        yield page["ids"], page["documents"], page["metadatas"]
+        offset += len(page["ids"])
+
+
+def score_collection(collection) -> Iterable[dict]:
+    """Yield every chunk's metadata, scoring (and persisting) chunks not yet scored."""
+    for ids, docs, metas in _iter_chunks(collection):
+        todo = [i for i, m in enumerate(metas) if m.get("sentiment") is None]
+        if todo:
+            scores = score_texts([docs[i] or "" for i in todo])
+            for i, score in zip(todo, scores):
+                metas[i] = {**metas[i], "sentiment": float(score)}
+            collection.update(ids=[ids[i] for i in todo], metadatas=[metas[i] for i in todo])
+        yield from metas
+
+
+# ── Aggregation ─────────────────────────────────────────────────
+
+
+def aggregate(client, collections: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Build the (artist, source, day) aggregate table over *collections* (default: all)."""
+    if collections is None:
+        collections = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    cells: Dict[Tuple[str, str, int], List[float]] = {}
+    for name in collections:
+        collection = client.get_collection(name)
+        scored = 0
+        for meta in score_collection(collection):
+            artist, date_ts, score = meta.get("artist"), meta.get("date_ts"), meta.get("sentiment")
+            if artist is None or date_ts is None or score is None:
+                continue
+            day = (date_ts - BIN_ANCHOR_TS) // DAY_SECONDS
+            cell = cells.setdefault((artist, name, day), [0, 0.0, 0.0])
+            cell[0] += 1
+            cell[1] += score
+            cell[2] += score * score
+            scored += 1
+        print(f"[sentiment_aggregates] {name}: {scored} dated, artist-tagged chunks")
+
+    artists = sorted({k[0] for k in cells})
+    sources = sorted({k[1] for k in cells})
+    a_idx = {a: i for i, a in enumerate(artists)}
+    s_idx = {s: i for i, s in enumerate(sources)}
+    keys = sorted(cells, key=lambda k: (a_idx[k[0]], s_idx[k[1]], k[2]))
+    return {
+        "artists": np.array(artists),
+        "sources": np.array(sources),
+        "artist": np.array([a_idx[k[0]] for k in keys], dtype=np.int16),
+        "source": np.array([s_idx[k[1]] for k in keys], dtype=np.int16),
+        "day": np.array([k[2] for k in keys], dtype=np.int32),
+        "count": np.array([cells[k][0] for k in keys], dtype=np.int32),
+        "sum": np.array([cells[k][1] for k in keys], dtype=np.float64),
+        "sumsq": np.array([cells[k][2] for k in keys], dtype=np.float64),
+        "built_at": np.array(int(time.time())),
+    }
+
+
+def run_aggregation(client=None, path: str = AGGREGATES_PATH) -> None:
+    if client is None:
+        from test_chromd import setup_chroma
+        client = setup_chroma()
+    table = aggregate(client)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **table)
+    os.replace(tmp, path)
+    print(f"[sentiment_aggregates] wrote {len(table['day'])} rows to {path}")
+
+
+# ── Lookup ──────────────────────────────────────────────────────
+
+
+class SentimentAggregates:
+    """Read side of the aggregate table."""
+
+    def __init__(self, table: Dict[str, np.ndarray]):
+        self.artists = [str(a) for a in table["artists"]]
+        self.sources = [str(s) for s in table["sources"]]
+        self.artist = table["artist"]
+        self.source = table["source"]
+        self.day = table["day"]
+        self.count = table["count"]
+        self.sum = table["sum"]
+        self.sumsq = table["sumsq"]
+        self.built_at = int(table["built_at"])
+
+    def series(self, artist: str, bin_days: int, sources: Optional[List[str]] = None,
+               date_from: Optional[int] = None) -> Optional[BinnedSeries]:
+        """Trend line for *artist* in *bin_days* bins (optionally per source / after a date)."""
+        if artist not in self.artists:
+            return None
+        mask = self.artist == self.artists.index(artist)
+        if sources is not None:
+            wanted = [self.sources.index(s) for s in sources if s in self.sources]
+            mask &= np.isin(self.source, wanted)
+        if date_from is not None:
+            mask &= self.day >= (date_from - BIN_ANCHOR_TS) // DAY_SECONDS
+        if not mask.any():
+            return None
+        buckets = self.day[mask] // bin_days
+        first = int(buckets.min())
+        offsets = buckets - first
+        return BinnedSeries(
+            first_bucket=first,
+            bin_days=bin_days,
+            counts=np.bincount(offsets, weights=self.count[mask]),
+            sums=np.bincount(offsets, weights=self.sum[mask]),
+            sumsq=np.bincount(offsets, weights=self.sumsq[mask]),
+        )
+
+
+_loaded: Dict[str, Tuple[float, SentimentAggregates]] = {}
+
+
+def load_aggregates(path: str = AGGREGATES_PATH) -> Optional[SentimentAggregates]:
+    """Cached table; reloaded when the job rewrites the file, None before the first run."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with np.load(path) as data:
+        aggregates = SentimentAggregates({k: data[k] for k in data.files})
+    _loaded[path] = (mtime, aggregates)
+    return aggregates
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--interval", type=int, default=0,
+                            help="seconds between runs; 0 runs once")
+    args = arg_parser.parse_args()
+    while True:
+        run_aggregation()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -1,18 +1,22 @@
 from typing_extensions import TypedDict
 from langchain_ollama.llms import OllamaLLM
-from typing import Annotated, List
-import operator, asyncio
+from typing import Annotated, Callable, List
+import operator
 
 
 class State(TypedDict):
     query: str
+    user_query: str  # the user's question without the recent-queries history
+    session_id: str  # websocket user id; llm_gateway schedules fairly across sessions
     opt_query: str
-    response: Annotated[list, operator.add]
+    opt_queries: dict  # per-segment rewrites from query_rewrite: community/news/music
+    response: Annotated[list, operator.add]  # one list of documents.Doc per segment agent
     llm: OllamaLLM
     visited: Annotated[list, operator.add]
-    aggregated_response: str
+    aggregated_response: list  # every segment's Doc objects (documents.Doc)
     final_response: str
-    ollama_lock: asyncio.locks.Lock
     agents: List
     narrative: str  #hope this doesnt f anything up
-    recommendation: str  
\ No newline at end of file
+    recommendation: str
+    emit: Callable  # optional async emit(stage, delta, done=False) for token streaming
+    tool_decisions: list  # [{"segment", "tools", "source"}] from summarization_agent
\ No newline at end of file
@@ -20,7 +20,9 @@ st.subheader("Noteable Person Analayzer 🎤💃💫")
 # st.image(images[int(random.random() * len(images))], width=300)
 
 
-cache_mode = st.radio("LLM Cache Mode", ["Use Cache", "Clear Cache"], index=0)
+cache_mode = st.radio("LLM Cache Mode", ["Use Cache", "Clear Cache"], index=0,
+                      help="Use Cache answers a repeated question from the answer cache; "
+                           "Clear Cache regenerates it.")
 
 
 box = st.empty()
@@ -33,6 +35,16 @@ if "ws" not in st.session_state:
         st.stop()
 if "input" not in st.session_state:
     st.session_state.input = False
+def after_think(text):
+    """Answer text after the model's <think> block (None while still thinking).
+
+    Stages run with thinking disabled (see llm_gateway.THINK_TASKS) have no block."""
+    start = text.find("</think>")
+    if start != -1:
+        return text[start + 8:]
+    return None if text.lstrip().startswith("<think>") else text
+
+
 def send_query(query):
     st.session_state.input = True
     try:
@@ -41,30 +53,30 @@ def send_query(query):
 
         payload = json.dumps({"query": query, "mode": mode})
         st.session_state.ws.send(payload)
-        
-        st.session_state.ws.send(query)
-        response = st.session_state.ws.recv()
-        responses = json.loads(response)
-
-
-
 
         tab1, tab2, tab3 = st.tabs(["Summary", "Narrative/Recommendation", "Docs"])
-        with tab1:
-            raw1 = responses["summary"]
-            start = raw1.find("</think>")
-            if start == -1:
-                raise ValueError(f"No JSON found in LLM output: {raw1!r}")
-            tab1.write(raw1[start + 8:])
-        with tab2:
-            raw2 = responses["narrative/recommendation"]
-            start = raw2.find("</think>")
-            if start == -1:
-                raise ValueError(f"No JSON found in LLM output: {raw2!r}")
-            tab2.write(raw2[start + 8:])
-        with tab3:
-            raw2 = responses["response"]
-            tab3.write(raw2)
+        boxes = {"summary": tab1.empty(), "narrative": tab2.empty()}
+        streamed = {"summary": "", "narrative": ""}
+        # Token frames arrive as the agents generate; the "final" frame has the full answer
+        while True:
+            frame = json.loads(st.session_state.ws.recv())
+            stage = frame.get("stage")
+            if stage == "final":
+                break
+            if stage in streamed and frame.get("delta"):
+                streamed[stage] += frame["delta"]
+                answer = after_think(streamed[stage])
+                boxes[stage].write(answer if answer is not None else "_Thinking…_")
+
+        raw1 = after_think(frame["summary"])
+        if raw1 is None:
+            raise ValueError(f"No JSON found in LLM output: {frame['summary']!r}")
+        boxes["summary"].write(raw1)
+        raw2 = after_think(frame["narrative/recommendation"])
+        if raw2 is None:
+            raise ValueError(f"No JSON found in LLM output: {frame['narrative/recommendation']!r}")
+        boxes["narrative"].write(raw2)
+        tab3.write(frame["response"])
     except Exception:
         st.session_state.ws = websocket.create_connection("ws://localhost:8003/ws/user1")
         send_query(query)
@@ -1,34 +1,59 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import os
 import textwrap
+import time
 from typing import Any, Dict, List
 
-import requests
 from langchain_ollama.llms import OllamaLLM
 from dateutil import parser as date_parser
 from state import State
+from app_config import load_config
+from date_normalization import bucket_id, meta_bucket
+from sentiment_timeseries import bin_sentiment, detect_spikes
+from sentiment_aggregates import load_aggregates
+from artists import detect_artists
+from tool_planner import plan_tools
+import llm_gateway
+import mcp_client
+from documents import Doc
+from model_manager import manager
+from functools import lru_cache
+import calendar
 import numpy as np
 import json 
 
 
 # ── Config ──────────────────────────────────────────────────────────
 MAX_SNIPPETS = 3  # per segment
+MAX_SPIKE_DOCS = 5  # docs quoted per sentiment spike
+MAX_TREND_BINS = 12  # most recent bins shown as the trend line
 MAX_PROMPT_TOK = 1500  # rough whitespace-token safeguard
-TOOL_API_URL = "http://localhost:8002"
+
+
+@lru_cache(maxsize=8)
+def _epoch(date_str: str) -> int:
+    return calendar.timegm(date_parser.parse(date_str).utctimetuple())
 
 
 def get_date_after_cutoff(meta):
-    cutoff = date_parser.parse("2024-06-07")
-    date_str = meta.get("date") if meta else None
-    if date_str:
+    """Return the doc's epoch date (``date_ts``) if it is after the cutoff, else None.
+
+    Dates are normalized at index time, so this is an integer comparison; only
+    chunks from an older index without ``date_ts`` fall back to parsing."""
+    if not meta:
+        return None
+    cutoff_ts = _epoch(load_config()["cutoff"])
+    date_ts = meta.get("date_ts")
+    if date_ts is None and meta.get("date"):
         try:
-            dt = date_parser.parse(date_str)
-            # more recent, higher score
-            return dt if dt > cutoff else None
+            date_ts = _epoch(meta["date"])
         except Exception:
             return None
-    return None
+    # more recent, higher score
+    return date_ts if date_ts is not None and date_ts > cutoff_ts else None
 
 
 # -------------------------------------------------------------------
@@ -90,7 +115,7 @@ def make_prompt(
 # Helper: ask LLM which extra tools to call
 # -------------------------------------------------------------------
 async def llm_decide_tools(
-    llm, query: str, segment: str, docs: List[Dict[str, Any]]
+    llm, query: str, segment: str, docs: List[Dict[str, Any]], session_id: str | None = None
 ) -> List[str]:
     """Use LLM to decide which tools to call for a segment."""
     doc_titles = [d.get("metadata", {}).get("title", "Untitled") for d in docs[:3]]
@@ -112,7 +137,7 @@ async def llm_decide_tools(
         "Reply with a comma-separated list of tool names (from the available tools) only."
     )
 
-    resp = await llm.ainvoke(prompt)
+    resp = await llm_gateway.ainvoke(llm, prompt, "tool_selection", session_id)
     tools = [t.strip() for t in resp.lower().split(",") if t.strip() in tool_list]
 
     # dedupe preserving order
@@ -129,65 +154,63 @@ async def llm_decide_tools(
     return out
 
 
+async def decide_tools(
+    llm, query: str, segment: str, docs: List[Dict[str, Any]], session_id: str | None = None,
+    user_query: str | None = None,
+) -> tuple:
+    """Tool plan from the rule/classifier planner, falling back to the LLM.
+
+    The planner scores *user_query* (the raw question, as logged in
+    tool_decisions for training); the LLM sees *query* with its history.
+    Returns (tools, source) where source is "planner" or "llm"."""
+    planned = plan_tools(user_query or query, segment)
+    if planned is not None:
+        return planned, "planner"
+    return await llm_decide_tools(llm, query, segment, docs, session_id), "llm"
+
+
 # -------------------------------------------------------------------
 # Helper: call external analytics tools
 # -------------------------------------------------------------------
-# def call_tool(tool: str, collection: str, docs, top_k: int = 5):
-def call_tool(tool: str, collection: str, docs, top_k=None):
+# tool name -> (endpoint, response key)
+TOOL_ENDPOINTS = {
+    "geolocation": ("/geolocation_tool", "locations"),
+    "sentiment": ("/sentiment_tool", "sentiments"),
+    "ner": ("/ner_person_tool", "persons"),
+}
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "9"))
+
+_tool_semaphore: asyncio.Semaphore | None = None
+
+
+async def call_tool(tool: str, collection: str, docs, top_k=None):
     """Call local HTTP tool endpoints and return parsed list (or [])."""
-    url = TOOL_API_URL
+    global _tool_semaphore
+    if tool not in TOOL_ENDPOINTS:
+        return []
+    if _tool_semaphore is None:
+        _tool_semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+    path, key = TOOL_ENDPOINTS[tool]
 
     try:
-        # if tool == "trend":
-        #     payload = {"collection": collection}
-        #     print(f"[summarization_agent] [TOOL CALL] trend_tool payload: {payload}")
-        #     resp = requests.post(f"{url}/trend_tool", json=payload)
-        #     resp.raise_for_status()
-        #     data = resp.json()
-        #     print(f"[summarization_agent] [TOOL RESPONSE] trend_tool: {data}")
-        #     return data.get("trends", [])
-
-        if tool == "geolocation":
-            payload = {"docs": docs}
-            print(
-                f"[summarization_agent] [TOOL CALL] geolocation_tool payload: {payload}"
-            )
-            resp = requests.post(f"{url}/geolocation_tool", json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            print(f"[summarization_agent] [TOOL RESPONSE] geolocation_tool: {data}")
-            return data.get("locations", [])
-
-        if tool == "sentiment":
-            # payload = {"docs": docs, "top_k": top_k}
-            payload = {"docs": docs}
-            print(
-                f"[summarization_agent] [TOOL CALL] sentiment_tool payload: {payload}"
-            )
-            resp = requests.post(f"{url}/sentiment_tool", json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            print(data)
-            print(f"[summarization_agent] [TOOL RESPONSE] sentiment_tool: {data}")
-            return data.get("sentiments", [])
-
-        if tool == "ner":
-            payload = {"docs": docs}
-            print(
-                f"[summarization_agent] [TOOL CALL] ner_person_tool payload: {payload}"
-            )
-            resp = requests.post(f"{url}/ner_person_tool", json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            print(f"[summarization_agent] [TOOL RESPONSE] ner_person_tool: {data}")
-            return data.get("persons", [])
+        async with _tool_semaphore:
+            print(f"[summarization_agent] [TOOL CALL] {tool} ({len(docs)} docs)")
+            data = await mcp_client.post(path, {"docs": docs})
+        print(f"[summarization_agent] [TOOL RESPONSE] {tool}: {len(data.get(key, []))} items")
+        return data.get(key, [])
 
     except Exception as e:
-        print(f"[summarization_agent] [TOOL ERROR] {tool} ({docs}): {e}")
+        print(f"[summarization_agent] [TOOL ERROR] {tool}: {e!r}")
 
     return []  # fallthrough
 
 
+async def _timed_tool(segment: str, tool: str, docs) -> tuple:
+    start = time.perf_counter()
+    result = await call_tool(tool, None, docs)
+    return segment, tool, result, time.perf_counter() - start
+
+
 # -------------------------------------------------------------------
 # Main summarization agent
 # -------------------------------------------------------------------
@@ -197,30 +220,23 @@ async def summarization_agent(state: State) -> Dict[str, List[str]]:
     Returns state update: {"final_response": summary_text}.
     """
     query = state["query"]
-    payloads = state["response"]
-    print("[summarization_agent] received", len(payloads), "payload strings")
-
-    # 1. Parse payloads into segment buckets -----------------------------------
-    comm_docs: List[Dict[str, Any]] = []
-    news_docs: List[Dict[str, Any]] = []
-    music_docs: List[Dict[str, Any]] = []
-
-    for idx, p in enumerate(payloads, 1):
-        try:
-            docs = json.loads(p)
-            print(f"[summarization_agent] payload {idx} → {len(docs)} docs")
-        except Exception as e:
-            print("[summarization_agent] JSON parse error:", e)
-            continue
-
-        for d in docs:
-            seg = d.get("segment", "unknown")
-            if seg == "community":
-                comm_docs.append(d)
-            elif seg == "news":
-                news_docs.append(d)
-            elif seg == "music":
-                music_docs.append(d)
+    all_docs: List[Doc] = state.get("aggregated_response") or [
+        d for payload in state["response"] for d in payload
+    ]
+    print("[summarization_agent] received", len(all_docs), "docs")
+
+    # 1. Split the typed docs into segment buckets -----------------------------
+    comm_docs: List[Doc] = []
+    news_docs: List[Doc] = []
+    music_docs: List[Doc] = []
+
+    for d in all_docs:
+        if d.segment == "community":
+            comm_docs.append(d)
+        elif d.segment == "news":
+            news_docs.append(d)
+        elif d.segment == "music":
+            music_docs.append(d)
 
     print(
         "[summarization_agent] totals | community:",
@@ -238,10 +254,53 @@ async def summarization_agent(state: State) -> Dict[str, List[str]]:
 
     # print("ahh doc source", docs[0].get("source"))
 
-    # 2. Decide which analytic tools to call (community + news only) -----------
+    # 2. Decide which analytic tools to call, then run them concurrently -------
     llm: OllamaLLM = state["llm"]
+    session_id = state.get("session_id")
+    user_query = state.get("user_query") or query
+    selector_llm = manager.llm_for("tool_selection")  # small tier
+
+    segments = [
+        (segment, docs)
+        for segment, docs in [
+            ("community", comm_docs),
+            ("news", news_docs),
+            ("music", music_docs),
+        ]
+        if docs
+    ]
+    plans = await asyncio.gather(
+        *(decide_tools(selector_llm, query, segment, docs, session_id, user_query)
+          for segment, docs in segments)
+    )
 
     tool_results: Dict[str, Dict[str, List]] = {}
+    tool_decisions = []
+    calls = []
+    for (segment, docs), (tools, source) in zip(segments, plans):
+        print(f"[summarization_agent] {source} selected tools for {segment}: {tools}")
+        tool_decisions.append({"segment": segment, "tools": tools, "source": source})
+        tool_results[segment] = {tool: [] for tool in tools}
+        calls.extend(_timed_tool(segment, tool, docs) for tool in tools)
+
+    started = time.perf_counter()
+    timings = []
+    for segment, tool, result, elapsed in await asyncio.gather(*calls):
+        tool_results[segment][tool].extend(result)
+        timings.append((elapsed, f"{segment}/{tool}"))
+    wall = time.perf_counter() - started
+    if timings:
+        slowest, slowest_name = max(timings)
+        print(
+            f"[summarization_agent] {len(timings)} tool calls in {wall:.2f}s wall "
+            f"(critical path: {slowest_name} {slowest:.2f}s; "
+            f"sequential would be {sum(t for t, _ in timings):.2f}s)"
+        )
+    # 2b. Sentiment time series -------------------------------------------------
+    # Bin the scored docs by date bucket and flag positive/negative spikes.
+    cfg = load_config()
+    bin_days = int(cfg["bin_days"])
+    dated_docs, buckets, scores = [], [], []
     for segment, docs in [
         ("community", comm_docs),
         ("news", news_docs),
@@ -250,187 +309,72 @@ async def summarization_agent(state: State) -> Dict[str, List[str]]:
         if not docs:
             continue
 
-        collections = list({d.get("source") for d in docs if d.get("source")})
-
-        print(collections)
-
-        tools = await llm_decide_tools(llm, query, segment, docs)
-
-        print("ahhhh segment ", segment)
-
-        print(f"[summarization_agent] LLM selected tools for {segment}: {tools}")
-        print(docs)
-        seg_results: Dict[str, List] = {}
-        for tool in tools:
-            seg_results[tool] = []
-            if tool == "sentiment" or tool == "ner" or tool == "geolocation":
-                print(
-                    f"[summarization_agent] Calling tool '{tool}' for "
-                    f"segment '{segment}'"
-                )
-                # seg_results[tool].extend(call_tool(tool, None, docs, top_k=12)) #test for now
-                seg_results[tool].extend(call_tool(tool, None, docs))  # test for now
-            # probably taking this out
-            else:
-                for collection in collections:
-                    print("formatting issue if thsi is called")
-                    print(
-                        f"[summarization_agent] Calling tool '{tool}' for "
-                        f"segment '{segment}'"
-                    )
-                    seg_results[tool].extend(call_tool(tool, collection, docs=None))
-
-        tool_results[segment] = seg_results
-    updated_docs = []
-    for segment, docs in [
-        ("community", comm_docs),
-        ("news", news_docs),
-        ("music", music_docs),
-    ]:
-        if not docs:
-            continue
-
-        print(f"[debug] segment = {segment}")
-        print(f"[debug] len(docs) = {len(docs)}")
-        # print(f"[debug] len(dates) = {len(dates)}")
-        print(f"[debug] len(sentiment) = {len(tool_results[segment]['sentiment'])}")
-        print(f"sentiment {tool_results[segment]['sentiment']} ")
-
-        dates = [get_date_after_cutoff(doc.get("metadata")) for doc in docs]
-
-        # we are going to need to take out top k everywhere
-
-        if len(docs) != len(tool_results[segment]["sentiment"]):
-            print("thats fine ig")
-            # print("that's probably an issue")
-
-        updated_docs.extend(zip(docs, dates, tool_results[segment]["sentiment"]))
-    print("updated docs")
-    print(updated_docs)
-    cleaned_docs = [doc for doc in updated_docs if doc[1] is not None]
-    cleaned_docs.sort(key=lambda x: x[1])
-    print(cleaned_docs)
-
-    # Bin cleaned_docs into two-week periods from cutoff date
-    from datetime import timedelta, datetime
-
-    cutoff = date_parser.parse("2024-06-07")
-    if cleaned_docs:
-        last_date = cleaned_docs[-1][1]
-    else:
-        last_date = cutoff
-    bin_size = timedelta(days=14)
-    
-
-    with open("config.json", "r") as f:
-        cfg = json.load(f)
-
-    BIN_DAYS_DEFAULT = 14
-    CUTOFF_DEFAULT = "2024-06-07"
-
-    bin_days = int(cfg.get("bin_days", BIN_DAYS_DEFAULT))
-    cutoff_str = cfg.get("cutoff", CUTOFF_DEFAULT)
-    cutoff = date_parser.parse(cutoff_str)
-
-    bin_size = timedelta(days=bin_days)
-
-
-
-    # Calculate number of bins needed
-    num_bins = ((last_date - cutoff).days // BIN_DAYS_DEFAULT) + 1
-    bins = {i: [] for i in range(num_bins)}
-
-    for doc_tuple in cleaned_docs:
-        date = doc_tuple[1]
-        if date >= cutoff:
-            bin_index = (date - cutoff).days // BIN_DAYS_DEFAULT
-            bins[bin_index].append(doc_tuple)
-    # Optionally, label bins with date ranges
-    bin_labels = {}
-    for i in range(num_bins):
-        start = cutoff + i * bin_size
-        end = start + bin_size - timedelta(days=1)
-
-        doc_tuples = bins[i]
-
-        for doc in doc_tuples:
-            print("sentiment field", doc[2])
-        # if doc_tuples:
-        sentiment_scores = [
-            doc[2] for doc in doc_tuples if isinstance(doc[2], (int, float))
-        ]
-
-        print("sentiment scores, ", sentiment_scores)
-
-        # if sentiment_scores:
-        #     mean_sentiment = sum(sentiment_scores) / len(sentiment_scores)
-        #     print("mean_sentiment ", mean_sentiment)
-
-        # else:
-        #     mean_sentiment = 0 #idk if empty
-
-        if not sentiment_scores:
-            continue  # do not include if empty
-
-        mean_sentiment = sum(sentiment_scores) / len(sentiment_scores)
-        print(f"[BIN {i}] mean_sentiment = {mean_sentiment:.3f}")
-
-        bin_labels[f"{start.date()} to {end.date()}"] = {
-            "docs": doc_tuples,
-            "mean_sentiment": mean_sentiment,
-        }
-
-        # bin_labels[f"{start.date()} to {end.date()}"] = bins[i]
-    print("bin labels")
-    print(bin_labels)
-    print(type(bin_labels))
-
-    all_mean_sentiments = [data["mean_sentiment"] for data in bin_labels.values()]
-    mean_sent = np.mean(all_mean_sentiments)
-    std_sent = np.std(all_mean_sentiments)
+        seg_scores = tool_results[segment].get("sentiment", [])
+        if len(docs) != len(seg_scores):
+            print(
+                f"[summarization_agent] {segment}: {len(docs)} docs vs "
+                f"{len(seg_scores)} sentiment scores"
+            )
 
-    threshold = mean_sent + 2 * std_sent  # maybe increase from 2
+        for doc, score in zip(docs, seg_scores):
+            meta = doc.get("metadata")
+            date_ts = get_date_after_cutoff(meta)
+            if date_ts is None or not isinstance(score, (int, float)):
+                continue
+            bucket = meta_bucket(meta, bin_days)
+            if bucket is None:  # legacy chunk without date_ts
+                bucket = bucket_id(date_ts, bin_days)
+            dated_docs.append(doc)
+            buckets.append(bucket)
+            scores.append(score)
+
+    bucket_arr = np.asarray(buckets, dtype=np.int64)
+    score_arr = np.asarray(scores, dtype=np.float64)
+    series = bin_sentiment(score_arr, bin_days, buckets=bucket_arr)
+    trend_source = "retrieved docs"
+
+    # Prefer the corpus-wide trend for the queried artist when the
+    # sentiment_aggregates job has run: spikes over every scored chunk rather
+    # than the handful retrieved for this query.
+    query_artists = detect_artists(query)
+    aggregates = load_aggregates()
+    if aggregates is not None and len(query_artists) == 1:
+        corpus_series = aggregates.series(
+            query_artists[0], bin_days, date_from=_epoch(cfg["cutoff"])
+        )
+        if corpus_series is not None:
+            series = corpus_series
+            trend_source = f"all {query_artists[0]} coverage"
+
+    spikes = detect_spikes(
+        series,
+        method=cfg["spike_method"],
+        threshold=float(cfg["spike_threshold"]),
+        window=int(cfg["spike_window"]),
+    )
     print(
-        f"\n[spike detection] Mean: {mean_sent:.4f}, Std: {std_sent:.4f}, Threshold: {threshold:.4f}"
+        f"[summarization_agent] trend from {trend_source}: "
+        f"{0 if series is None else int((series.counts > 0).sum())} bins "
+        f"({bin_days}-day); {cfg['spike_method']} found {len(spikes)} spikes"
     )
-    # pos
 
-    # sentiment_spikes = []
-    # for label, data in bin_labels.items():
-    #     if data["mean_sentiment"] > threshold:
-    #         print(data["docs"])
-    #         sentiment_spikes.append((label, data["mean_sentiment"]))
     sentiment_spikes = []
-    for label, data in bin_labels.items():
-        if data["mean_sentiment"] > threshold:
-            print(f"\n[SPIKE] {label} — mean sentiment: {data['mean_sentiment']:.3f}")
-            print("Top documents in this bin:")
-            doc_list = []
-            for i, doc_tuple in enumerate(data["docs"]):
-                doc = doc_tuple[0]
-                text = doc.get("document", "[no text]")
-                doc_list.append(
-                    f"Doc {i+1}: {text[:300]}{'...' if len(text) > 300 else ''}"
-                )
-                # print(f"  Doc {i+1}: {text[:300]}{'...' if len(text) > 300 else ''}")  # limit to 300 chars
-            # sentiment_spikes.append((label, data["mean_sentiment"]))
-
-            sentiment_spikes.append(
-                {
-                    "range": label,
-                    "mean_sentiment": data["mean_sentiment"],
-                    "docs": "\n".join(doc_list),
-                }
+    for spike in spikes:
+        in_bin = np.flatnonzero(bucket_arr == spike["bucket"])
+        # strongest docs in the spike's direction first
+        sign = 1 if spike["direction"] == "up" else -1
+        in_bin = in_bin[np.argsort(-sign * score_arr[in_bin])][:MAX_SPIKE_DOCS]
+        doc_list = []
+        for i, idx in enumerate(in_bin):
+            text = dated_docs[idx].get("document", "[no text]")
+            doc_list.append(
+                f"Doc {i+1}: {text[:300]}{'...' if len(text) > 300 else ''}"
             )
-
-    print("\n[Sentiment Spikes Detected]")
-    for label, score in sentiment_spikes:
-        print(f" {label} — mean sentiment: {score:.3f}")
-
-    #     print("Top documents:")
-    # for i, doc_tuple in enumerate(data["docs"][:5]):  # adjust the slice to show more/less
-    #     doc_text = doc_tuple[0].get("document") or "[no text]"
-    #     print(f"  Doc {i+1}: {doc_text[:200]}{'...' if len(doc_text) > 200 else ''}")
+        sentiment_spikes.append({**spike, "docs": "\n".join(doc_list)})
+        print(
+            f"[SPIKE {spike['direction']}] {spike['range']} — mean sentiment: "
+            f"{spike['mean_sentiment']:.3f} (score {spike['score']:.2f})"
+        )
 
     # 3. Representative snippet selection --------------------------------------
     comm_sel = pick_snippets(comm_docs)
@@ -469,11 +413,21 @@ async def summarization_agent(state: State) -> Dict[str, List[str]]:
                 tool_results_lines.append(f"- {tool}: {res}")
 
     sentiment_analysis = []
-    if "sentiment_spikes" in tool_results and tool_results["sentiment_spikes"]:
+    if series is not None:
+        nonempty = np.flatnonzero(series.counts > 0)[-MAX_TREND_BINS:]
+        means = series.means
+        sentiment_analysis.append(f"Sentiment Trend ({trend_source}):")
+        sentiment_analysis.extend(
+            f"- {series.label(int(i))}: {means[i]:.3f} (n={int(series.counts[i])})"
+            for i in nonempty
+        )
+    if sentiment_spikes:
         sentiment_analysis.append("Sentiment Spikes:")
-        for spike in tool_results["sentiment_spikes"]:
-            tool_results_lines.append(
-                f"- Range: {spike['range']}, Mean Sentiment: {spike['mean_sentiment']:.3f}, Related Docs: {spike["docs"]}"
+        for spike in sentiment_spikes:
+            arrow = "↑" if spike["direction"] == "up" else "↓"
+            sentiment_analysis.append(
+                f"- Range: {spike['range']}, Mean Sentiment: {spike['mean_sentiment']:.3f} {arrow}, "
+                f"Related Docs: {spike['docs']}"
             )
 
     tool_results_str = "\n".join(tool_results_lines)
@@ -529,7 +483,7 @@ async def summarization_agent(state: State) -> Dict[str, List[str]]:
 
     # 7. LLM call ---------------------------------------------------------------
     print("[summarization_agent] invoking DeepSeek R1 model …")
-    summary = await llm.ainvoke(prompt)
+    summary = await llm_gateway.astream(llm, prompt, "summary", session_id, state.get("emit"))
     print("[summarization_agent] LLM call complete")
 
     # 8. Assemble final response ------------------------------------------------
@@ -537,4 +491,4 @@ async def summarization_agent(state: State) -> Dict[str, List[str]]:
     # (We intentionally do NOT prepend tool_results_str here to reduce redundancy.)
     final_response = summary.strip()
 
-    return {"final_response": final_response}
+    return {"final_response": final_response, "tool_decisions": tool_decisions}
@@ -12,6 +12,14 @@ import os
 from langchain_community.llms import Ollama
 import datetime
 from dateutil import parser as date_parser
+import lexical_index
+import distance_calibration
+import collection_router
+import quantized_index
+import hnsw_tuning
+from index_build import publish_build_id
+from artists import artist_for_chunk
+from date_normalization import date_metadata, extract_date_from_text
 from chunking_config import (
     get_chunking_params, 
     get_preprocessing_config, 
@@ -374,7 +382,6 @@ def get_dynamic_chunk_params(text_length):
 
 
 def embed_data_with_chunking(rows, collection_name, embedder, client, chunk_size=512, overlap=50):
-    collection = client.get_or_create_collection(name=collection_name)
     ids, texts, metadatas = [], [], []
     id_set = set()
     chunk_type = collection_name.replace('_embeddings', '')
@@ -431,20 +438,6 @@ def embed_data_with_chunking(rows, collection_name, embedder, client, chunk_size
                 print(f"[DEBUG] Transformed Beyonce tour date to: '{date}' (YYYY-MM-DD)")
             else:
                 print(f"[DEBUG] Beyonce tour date did not match expected format: '{date}'")
-        # Try to extract a date from title, body, or location if date is missing
-        if date is None:
-            for text_field in [title, body]:
-                if text_field:
-                    import re
-                    date_match = re.search(
-                        r'(\w{3,9} \d{1,2}, \d{4})', str(text_field))
-                    if date_match:
-                        try:
-                            date = date_parser.parse(date_match.group(1))
-                            print(f"Extracted date from text field: {date}")
-                            break
-                        except Exception as e:
-                            print(f"Could not parse date from text field: {e}")
         # Always build a non-empty text for chunking
         full_text = f"{title or ''} {body or ''}".strip()
         if not full_text:
@@ -455,26 +448,14 @@ def embed_data_with_chunking(rows, collection_name, embedder, client, chunk_size
         dynamic_chunk_size, dynamic_overlap = get_dynamic_chunk_params(
             len(full_text))
         chunks = simple_chunk(full_text, dynamic_chunk_size, dynamic_overlap)
-        # --- Print and normalize date ---
-        parsed_date = None
-        date_str = None
-        if date is not None:
-            try:
-                print(f"[DEBUG] Attempting to parse date: '{date}' (type: {type(date)})")
-                if isinstance(date, (datetime.datetime, datetime.date)):
-                    parsed_date = date
-                    date_str = date.isoformat()
-                else:
-                    parsed_date = date_parser.parse(str(date))
-                    date_str = parsed_date.isoformat()
-                print(f"[DEBUG] Successfully parsed date: {parsed_date} (ISO: {date_str})")
-            except Exception as e:
-                print(f"Could not parse date '{date}': {e}")
-                parsed_date = None
-            print(
-                f"Entry UID: {uid} | Raw date: {date} | Parsed datetime: {parsed_date}")
+        # --- Normalize date (epoch seconds, week/biweek buckets, confidence) ---
+        date_meta = date_metadata(date, title, body)
+        if date_meta:
+            print(f"Entry UID: {uid} | Raw date: {date} | Normalized: {date_meta}")
         else:
-            print(f"Entry UID: {uid} | No date field present. Full row: {row}")
+            print(f"Entry UID: {uid} | No usable date. Full row: {row}")
+        # Canonical artist so /rag can filter with Chroma `where`
+        chunk_artist = artist_for_chunk(collection_name, artist, title, body)
         for i, chunk in enumerate(chunks):
             base_id = f"{uid}_chunk_{i}"
             unique_id = base_id
@@ -500,11 +481,12 @@ def embed_data_with_chunking(rows, collection_name, embedder, client, chunk_size
                 "chunk_strategy": "dynamic",
                 "chunk_type": chunk_type,
                 "rank": rank,
-                "artist": artist,
+                "artist_name": artist,
                 "date": date
                 }
-            if date_str is not None:
-                meta["date"] = date_str
+            meta.update(date_meta)
+            if chunk_artist is not None:
+                meta["artist"] = chunk_artist
             print(f"DEBUG META: {meta}")
             metadatas.append(meta)
             ids.append(unique_id)
@@ -512,12 +494,41 @@ def embed_data_with_chunking(rows, collection_name, embedder, client, chunk_size
     if not texts:
         logging.getLogger(__name__).info(
             f"No valid texts to embed in collection '{collection_name}'.")
+        client.get_or_create_collection(name=collection_name)
         return
+    # HNSW params of the collection's size class (hnsw_params.json), sized by the
+    # larger of stored and new chunks; Chroma fixes them at creation, so a
+    # collection built with other params is swapped for a re-created copy
+    collection = hnsw_tuning.ensure_collection(client, collection_name, len(texts))
+    hnsw_metadata = collection.metadata or {}
+    logging.getLogger(__name__).info(
+        f"Collection '{collection_name}' ({hnsw_metadata.get('size_class')}): "
+        f"M={hnsw_metadata.get('hnsw:M')}, construction_ef={hnsw_metadata.get('hnsw:construction_ef')}, "
+        f"search_ef={hnsw_metadata.get('hnsw:search_ef')}")
     logging.getLogger(__name__).info(
         f"Embedding {len(texts)} chunks into '{collection_name}'...")
-    collection.add(documents=texts, ids=ids, metadatas=metadatas)
+    # upsert: chunks from earlier builds get the current (date_ts / artist) metadata
+    collection.upsert(documents=texts, ids=ids, metadatas=metadatas)
     logging.getLogger(__name__).info(
         f"Indexed {len(texts)} chunks into '{collection_name}'.")
+    # Lexical (BM25) index over the whole collection, used for hybrid retrieval
+    bm25 = lexical_index.build_from_collection(collection)
+    logging.getLogger(__name__).info(
+        f"Built BM25 index ({len(bm25)} chunks) for '{collection_name}' at "
+        f"{lexical_index.index_path(collection_name)}.")
+    # Background distance stats, so _rag can compare distances across collections
+    calibration = distance_calibration.calibrate_and_save(collection)
+    if calibration:
+        logging.getLogger(__name__).info(
+            f"Calibrated '{collection_name}': distance mean {calibration['mean']:.4f}, "
+            f"std {calibration['std']:.4f} over {calibration['samples']} samples.")
+    # Centroid embedding for rag_mcp_api's collection router
+    collection_router.build_and_save(collection)
+    # Optional int8/float16 copy of the vectors (QUANTIZED_DTYPE) for RAG_VECTOR_STORE=quantized
+    if quantized_index.build_and_save(collection):
+        logging.getLogger(__name__).info(
+            f"Built {quantized_index.QUANT_DTYPE} vector sidecar for '{collection_name}' "
+            f"at {quantized_index.index_path(collection_name)}.")
 
 # ── Run Semantic Search ─────────────────────────────────────────
 
@@ -530,25 +541,16 @@ def semantic_search(collection, query, top_k=5):
     for i, (doc, meta) in enumerate(zip(results["documents"][0], results["metadatas"][0])):
         print(f"\n[{i+1}] Metadata: {meta}")
         print(f"Document: {doc[:300]}{'...' if len(doc) > 300 else ''}")
-        date_str = meta.get('date', None)
-        parsed_date = None
-        if date_str:
-            try:
-                parsed_date = date_parser.parse(date_str)
-                print(f"Parsed datetime: {parsed_date}")
-            except Exception as e:
-                print(f"Could not parse date '{date_str}': {e}")
+        if meta.get("date_ts") is not None:
+            print(f"Date: {meta.get('date')} (epoch {meta['date_ts']}, "
+                  f"confidence: {meta.get('date_confidence', 'unknown')})")
         else:
             # Try to parse a date from the document text itself
-            date_match = re.search(r'(\w{3,9} \d{1,2}, \d{4})', doc)
-            if date_match:
-                try:
-                    parsed_date = date_parser.parse(date_match.group(1))
-                    # <-- Add to metadata for display
-                    meta['date'] = parsed_date.isoformat()
-                    print(f"Parsed date from document: {parsed_date}")
-                except Exception as e:
-                    print(f"Could not parse date from document: {e}")
+            parsed_date = extract_date_from_text(doc)
+            if parsed_date:
+                # <-- Add to metadata for display
+                meta['date'] = parsed_date.isoformat()
+                print(f"Parsed date from document: {parsed_date}")
             else:
                 print("No date available for this entry.")
         # Now print the enriched metadata
@@ -672,6 +674,8 @@ def main():
             print(f"Embedding for collection: {collection}")
             rows = fetch_func()
             embed_data_with_chunking(rows, collection, embedder, chroma_client)
+        # New build id invalidates answers cached against the previous corpus
+        logger.info(f"Published index build {publish_build_id()}")
     else:
         logger.info("Using existing collections (may have old metadata format)")
     # Query and print results for confirmation
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tool_planner
+
+
+@pytest.fixture
+def untrained(monkeypatch):
+    monkeypatch.setattr(tool_planner, "load_model", lambda: None)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("How do fans feel about Taylor Swift's new album?", ["sentiment"]),
+    ("Where is BLACKPINK touring this summer?", ["geolocation", "sentiment"]),
+    ("Who did Stray Kids collaborate with, featuring which producer?", ["sentiment", "ner"]),
+    ("Which cities did SZA play and who opened for her?", ["geolocation", "sentiment", "ner"]),
+])
+def test_untrained_planner_skips_llm(untrained, query, expected):
+    assert tool_planner.plan_tools(query, "community") == expected
+
+
+def test_uncertain_classifier_falls_back_to_llm(monkeypatch):
+    # a trained classifier leaning against the rules leaves the decision to the LLM
+    monkeypatch.setattr(tool_planner, "load_model", lambda: {"tools": {}})
+    monkeypatch.setattr(tool_planner, "classifier_prob", lambda model, tool, query, segment: 0.6)
+    assert tool_planner.plan_tools("How do fans feel about the album?", "community") is None
@@ -0,0 +1,185 @@
+"""
+Tool planner for the summarization agent
+Picks the analytic tools (geolocation, sentiment, ner) for a segment without
+an LLM call: keyword rules plus a small naive Bayes classifier trained on the
+tool choices the LLM made before (logged to the `tool_decisions` table by
+proxy_client1).
+
+The rules alone are confident either way (a keyword hit or miss), so an
+ordinary query is planned without the LLM even before any training.
+plan_tools() returns None only when it is not confident, i.e. a trained
+classifier disagrees with the rules, and the caller then falls back to
+llm_decide_tools.
+
+Train / refresh the classifier from the logged decisions:
+    python tool_planner.py --train
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# ── Config ──────────────────────────────────────────────────────
+TOOLS = ["geolocation", "sentiment", "ner"]
+MODEL_PATH = os.getenv("TOOL_PLANNER_MODEL", "./tool_planner_model.json")
+CONFIDENCE_THRESHOLD = float(os.getenv("TOOL_PLANNER_CONFIDENCE", "0.6"))
+TOOL_DECISIONS_DDL = '''
+    CREATE TABLE IF NOT EXISTS tool_decisions (
+        id SERIAL PRIMARY KEY,
+        session_id TEXT,
+        user_query TEXT,
+        segment TEXT,
+        tools TEXT[],
+        source TEXT,
+        timestamp TIMESTAMPTZ DEFAULT NOW()
+    );
+'''
+
+# Keyword rules: a hit pushes the tool in, no hit pushes it (mildly) out.
+TOOL_KEYWORDS = {
+    "geolocation": {
+        "where", "city", "cities", "country", "countries", "location", "locations",
+        "place", "places", "venue", "venues", "stadium", "arena", "tour", "tours",
+        "concert", "concerts", "show", "shows", "travel", "map", "region", "international",
+    },
+    "ner": {
+        "who", "whom", "people", "person", "persons", "name", "names", "collab",
+        "collaboration", "collaborator", "feature", "featuring", "partner", "dating",
+        "boyfriend", "girlfriend", "member", "members", "manager", "producer",
+        "lawsuit", "sued", "involved", "associated", "related",
+    },
+}
+RULE_HIT_PROB = 0.9
+RULE_MISS_PROB = 0.1  # confident alone; only a disagreeing classifier makes it uncertain
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _features(query: str, segment: str) -> List[str]:
+    return _TOKEN_RE.findall((query or "").lower()) + [f"seg:{segment}"]
+
+
+def _logit(p: float) -> float:
+    p = min(max(p, 1e-6), 1 - 1e-6)
+    return math.log(p / (1 - p))
+
+
+# ── Classifier ──────────────────────────────────────────────────
+
+
+def train(decisions: List[Tuple[str, str, List[str]]]) -> Dict:
+    """Multinomial naive Bayes per tool from (query, segment, chosen tools) rows."""
+    model = {"n": len(decisions), "vocab": [], "tools": {}}
+    vocab = set()
+    for tool in TOOLS:
+        stats = {"docs": [0, 0], "tokens": [{}, {}], "totals": [0, 0]}
+        for query, segment, chosen in decisions:
+            label = 1 if tool in chosen else 0
+            stats["docs"][label] += 1
+            for tok in _features(query, segment):
+                vocab.add(tok)
+                counts = stats["tokens"][label]
+                counts[tok] = counts.get(tok, 0) + 1
+                stats["totals"][label] += 1
+        model["tools"][tool] = stats
+    model["vocab"] = sorted(vocab)
+    return model
+
+
+def classifier_prob(model: Dict, tool: str, query: str, segment: str) -> Optional[float]:
+    """P(tool is chosen | query, segment), or None when the tool was never seen."""
+    stats = model.get("tools", {}).get(tool)
+    if not stats or 0 in stats["docs"]:
+        return None
+    v = len(model["vocab"]) or 1
+    log_odds = math.log(stats["docs"][1] / stats["docs"][0])
+    for tok in _features(query, segment):
+        pos = (stats["tokens"][1].get(tok, 0) + 1) / (stats["totals"][1] + v)
+        neg = (stats["tokens"][0].get(tok, 0) + 1) / (stats["totals"][0] + v)
+        log_odds += math.log(pos / neg)
+    return 1 / (1 + math.exp(-max(min(log_odds, 50), -50)))
+
+
+_model_cache: Dict[str, Tuple[float, Dict]] = {}
+
+
+def load_model(path: str = MODEL_PATH) -> Optional[Dict]:
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _model_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r") as f:
+        model = json.load(f)
+    _model_cache[path] = (mtime, model)
+    return model
+
+
+# ── Planner ─────────────────────────────────────────────────────
+
+
+def tool_probabilities(query: str, segment: str) -> Dict[str, float]:
+    """Per-tool probability from the keyword rules, blended with the classifier."""
+    tokens = set(_TOKEN_RE.findall((query or "").lower()))
+    model = load_model()
+    probs = {"sentiment": 1.0}  # always run; the time-series stage needs it
+    for tool, keywords in TOOL_KEYWORDS.items():
+        rule = RULE_HIT_PROB if tokens & keywords else RULE_MISS_PROB
+        learned = classifier_prob(model, tool, query, segment) if model else None
+        if learned is None:
+            probs[tool] = rule
+        else:
+            # average the log-odds of rule and classifier
+            probs[tool] = 1 / (1 + math.exp(-(_logit(rule) + _logit(learned)) / 2))
+    return probs
+
+
+def plan_tools(query: str, segment: str,
+               threshold: float = CONFIDENCE_THRESHOLD) -> Optional[List[str]]:
+    """Tools for *segment*, or None when any decision is too uncertain."""
+    probs = tool_probabilities(query, segment)
+    confidence = min(abs(p - 0.5) * 2 for p in probs.values())
+    if confidence < threshold:
+        return None
+    return [tool for tool in TOOLS if probs[tool] >= 0.5]
+
+
+# ── Training from the tool_decisions table ──────────────────────
+
+
+def fetch_logged_decisions() -> List[Tuple[str, str, List[str]]]:
+    """(query, segment, tools) for every LLM tool choice logged by proxy_client1."""
+    import sys
+    import psycopg2
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'Database'))
+    from db_connection import get_secret
+
+    creds = get_secret("DB")
+    with psycopg2.connect(dbname=creds["dbname"], user=creds["user"],
+                          password=creds["password"], host=creds["host"],
+                          port=creds["port"]) as conn, conn.cursor() as cur:
+        cur.execute(TOOL_DECISIONS_DDL)
+        cur.execute("SELECT user_query, segment, tools FROM tool_decisions WHERE source = 'llm';")
+        rows = cur.fetchall()
+    return [(query, segment, list(tools or [])) for query, segment, tools in rows]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Tool planner for summarization_agent")
+    arg_parser.add_argument("--train", action="store_true",
+                            help="retrain the classifier from the tool_decisions table")
+    arg_parser.add_argument("--query", help="show the plan for a query")
+    arg_parser.add_argument("--segment", default="community")
+    args = arg_parser.parse_args()
+    if args.train:
+        decisions = fetch_logged_decisions()
+        with open(MODEL_PATH, "w") as f:
+            json.dump(train(decisions), f)
+        print(f"Trained tool planner on {len(decisions)} logged decisions -> {MODEL_PATH}")
+    if args.query:
+        print(tool_probabilities(args.query, args.segment), plan_tools(args.query, args.segment))